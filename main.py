@@ -1,3 +1,4 @@
+import argparse
 import time
 
 from src.config import settings
@@ -29,29 +30,48 @@ def pre_process(project: Project):
     #     star.download(download_link)
 
 
-def process(project: Project):
+def process(project: Project, args: argparse.Namespace):
     paratranz = Paratranz()
-    paratranz.download()
+    paratranz.download(force=args.force)  # nothing is downloaded or extracted without remote changes
 
-    Converter().convert()
-    Restorer().restore()
+    Converter(jobs=settings.convert.jobs if args.jobs is None else args.jobs).convert()
+    if args.push:
+        paratranz.sync_files()
+    Restorer(jobs=settings.restore.jobs if args.jobs is None else args.jobs).restore()
     Tweaker().tweak()
     project.package()
 
 
-def main():
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=settings.project.name)
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help="number of workers converting / restoring files in parallel, 0 for all cores"
+    )
+    parser.add_argument(
+        "-p", "--push", action="store_true",
+        help="upload converted files to Paratranz"
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true",
+        help="export, download and extract translated files even if nothing changed in Paratranz since last run"
+    )
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
     start = time.time()
     project = Project()
     """TODO: Download original game"""
     pre_process(project)
     """Pick up texts to translate & replace translated texts"""
-    process(project)
+    process(project, args)
     end = time.time()
     return end - start
 
 
 if __name__ == '__main__':
-    last = main()
+    last = main(parse_args())
     logger.info(f"===== Lasting {last or -1:.2f}s =====")
 
     Toaster(
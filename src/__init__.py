@@ -1,3 +1,4 @@
+from .codec import *
 from .config import *
 from .core import *
 from .exception import *
@@ -0,0 +1,86 @@
+"""Read / write json with the fastest backend installed."""
+import json
+from contextlib import suppress
+from typing import IO, Any
+
+from src.config import settings
+from src.log import logger
+from src.schema.enum import JsonBackend
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _select(backend: JsonBackend) -> JsonBackend:
+    installed = {
+        JsonBackend.ORJSON: orjson is not None,
+        JsonBackend.MSGSPEC: msgspec is not None,
+        JsonBackend.JSON: True,
+    }
+    if backend == JsonBackend.AUTO:
+        return next(backend_ for backend_, flag in installed.items() if flag)
+    if not installed[backend]:
+        logger.bind(project_name="Codec").warning(f"JSON backend {backend.value} not installed, fallback to json")
+        return JsonBackend.JSON
+    return backend
+
+
+BACKEND = _select(settings.project.json_backend)
+
+
+def json_loads(data: bytes | str) -> Any:
+    match BACKEND:
+        case JsonBackend.ORJSON:
+            # refuses integers over 64 bits
+            with suppress(orjson.JSONDecodeError):
+                return orjson.loads(data)
+        case JsonBackend.MSGSPEC:
+            with suppress(msgspec.DecodeError):
+                return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+def json_dumps(obj: Any, *, pretty: bool = False) -> bytes:
+    """
+    utf-8 json, never ascii-escaped
+
+    :param obj: object to serialize
+    :param pretty: indent with 2 spaces, otherwise no whitespace at all
+    :return: encoded bytes
+    """
+    match BACKEND:
+        case JsonBackend.ORJSON:
+            with suppress(orjson.JSONEncodeError):
+                return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0))
+        case JsonBackend.MSGSPEC:
+            with suppress(msgspec.EncodeError, TypeError, OverflowError):
+                data = msgspec.json.encode(obj)
+                return msgspec.json.format(data, indent=2) if pretty else data
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_load(fp: IO) -> Any:
+    """read from a text or binary file"""
+    return json_loads(fp.read())
+
+
+def json_dump(obj: Any, fp: IO[bytes], *, pretty: bool = False):
+    """write to a binary file"""
+    fp.write(json_dumps(obj, pretty=pretty))
+
+
+__all__ = [
+    "json_loads",
+    "json_dumps",
+    "json_load",
+    "json_dump",
+]
@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from src.schema.enum import CopyStrategy, DuplicatePolicy, Executor, JsonBackend
+
 load_dotenv()
 
 
@@ -16,6 +18,13 @@ class ProjectSettings(BaseSettings):
     username: str = Field(default="Anonymous")
     email: str = Field(default="anonymous@email.com")
     log_level: str = Field(default="INFO")
+    workspace: bool = Field(default=False)
+    strict: bool = Field(default=False)
+    json_backend: JsonBackend = Field(default=JsonBackend.AUTO)
+    cache_memory: int = Field(default=256)
+    snapshot: bool = Field(default=False)
+    copy_strategy: CopyStrategy = Field(default=CopyStrategy.COPY)
+    copy_by_hash: bool = Field(default=False)
     log_format: str = Field(
         default="<g>{time:HH:mm:ss}</g> | [<lvl>{level:^7}</lvl>] | {extra[project_name]}{message:<35}"
     )
@@ -38,6 +47,7 @@ class FilepathSettings(BaseSettings):
     data: Path = Field(default=Path("data"))
     dist: Path = Field(default=Path("dist"))
     log: Path = Field(default=Path("data/log"))
+    cache: Path = Field(default=Path("data/cache"))
     resource: Path = Field(default=Path("resource"))
     original: Path = Field(default=Path("resource/01-original"))
     convert: Path = Field(default=Path("resource/02-paratranz/convert"))
@@ -69,6 +79,42 @@ class ParatranzSettings(BaseSettings):
 
     project_id: str = Field(default="")
     token: str = Field(default="")
+    concurrency: int = Field(default=8)
+    retries: int = Field(default=5)
+    timeout: float = Field(default=30)
+    extract: bool = Field(default=True)
+    export_timeout: float = Field(default=600)
+    export_interval: float = Field(default=1)
+    offline: bool = Field(default=False)
+
+
+class ConvertSettings(BaseSettings):
+    """About converting game files to Paratranz format"""
+    model_config = SettingsConfigDict(env_prefix='CONVERT_')
+
+    duplicate_policy: DuplicatePolicy = Field(default=DuplicatePolicy.FIRST)
+    jobs: int = Field(default=1)
+    pretty: bool = Field(default=True)
+
+
+class RestoreSettings(BaseSettings):
+    """About restoring translated game files"""
+    model_config = SettingsConfigDict(env_prefix='RESTORE_')
+
+    jobs: int = Field(default=1)
+    executor: Executor = Field(default=Executor.PROCESS)
+    pretty: bool = Field(default=False)
+    optimize_png: bool = Field(default=False)
+
+
+class PackageSettings(BaseSettings):
+    """About packaging results"""
+    model_config = SettingsConfigDict(env_prefix='PACKAGE_')
+
+    jobs: int = Field(default=0)
+    incremental: bool = Field(default=True)
+    reproducible: bool = Field(default=True)
+    delta_from: str = Field(default="")
 
 
 # TODO: Download the latest game automatically
@@ -87,10 +133,14 @@ class Settings(BaseSettings):
     project: ProjectSettings = ProjectSettings()
     filepath: FilepathSettings = FilepathSettings()
     game: GameSettings = GameSettings()
+    convert: ConvertSettings = ConvertSettings()
+    restore: RestoreSettings = RestoreSettings()
+    package: PackageSettings = PackageSettings()
 
 
 settings = Settings()
 GAME_ROOT = settings.filepath.root / settings.filepath.original / f"{settings.game.name} v{settings.game.version} (PC) (Full)"
+DIR_CACHE = settings.filepath.root / settings.filepath.cache
 DIR_CONVERT = settings.filepath.root / settings.filepath.convert
 DIR_DOWNLOAD = settings.filepath.root / settings.filepath.download
 DIR_RESULT = settings.filepath.root / settings.filepath.result
@@ -101,6 +151,7 @@ __all__ = [
     "settings",
 
     "GAME_ROOT",
+    "DIR_CACHE",
     "DIR_CONVERT",
     "DIR_DOWNLOAD",
     "DIR_RESULT",
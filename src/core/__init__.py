@@ -1,8 +1,14 @@
 """Core functions and utilities."""
 
+from .archive import *
+from .cache import *
 from .converter import *
+from .download import *
+from .mirror import *
 from .paratranz import *
 from .project import *
+from .quest import *
 from .restorer import *
+from .segmenter import *
 from .subscribestar import *
 from .tweaker import *
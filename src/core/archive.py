@@ -0,0 +1,267 @@
+"""Zip archives compressed by worker threads and written in a fixed order."""
+import contextlib
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, NamedTuple
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+"""already compressed, deflating them again only costs time"""
+STORED_SUFFIXES = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp",
+    ".ogg", ".m4a", ".mp3", ".mp4", ".webm",
+    ".woff", ".woff2", ".zip", ".7z",
+    ".rpgmvp", ".rpgmvo", ".rpgmvm",
+}
+"""deflate level of everything else"""
+DEFLATE_LEVEL = 9
+
+_MAX32 = 0xFFFFFFFF
+_MAX16 = 0xFFFF
+"""sizes, offsets and counts from which zip64 records are needed"""
+_ZIP64_LIMIT = _MAX32
+_ZIP64_COUNT_LIMIT = _MAX16
+_UTF8_FLAG = 0x800
+
+
+class ArchiveFile(NamedTuple):
+    """a file to archive"""
+    path: Path
+    arcname: str
+    stat: os.stat_result
+
+
+class ArchiveEntry(NamedTuple):
+    """an archive member whose payload is already compressed"""
+    arcname: str
+    method: int
+    crc: int
+    size: int
+    payload: bytes
+    date_time: tuple[int, int, int, int, int, int]
+    mode: int = 0o644
+    """payload copied from the previous archive"""
+    reused: bool = False
+
+
+def scan(root: Path) -> list[ArchiveFile]:
+    """every file under `root` in one scandir pass, sorted by archive name"""
+    files, stack = [], [(root, "")]
+    while stack:
+        directory, prefix = stack.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir():
+                    stack.append((Path(entry.path), f"{prefix}{entry.name}/"))
+                elif entry.is_file():
+                    files.append(ArchiveFile(Path(entry.path), f"{prefix}{entry.name}", entry.stat()))
+    files.sort(key=lambda file: file.arcname)
+    return files
+
+
+def policy(arcname: str) -> tuple[int, int]:
+    """compression method and level of a member by its suffix"""
+    if os.path.splitext(arcname)[1].lower() in STORED_SUFFIXES:
+        return ZIP_STORED, 0
+    return ZIP_DEFLATED, DEFLATE_LEVEL
+
+
+def date_time(mtime: float) -> tuple[int, int, int, int, int, int]:
+    """local time as zip stores it, which cannot go before 1980"""
+    return max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
+
+
+"""time of every member in reproducible archives, `SOURCE_DATE_EPOCH` if set"""
+FIXED_DATE_TIME = max(time.gmtime(int(os.environ.get("SOURCE_DATE_EPOCH", 0)))[:6], (1980, 1, 1, 0, 0, 0))
+
+
+class PreviousArchive:
+    """members of an archive built before, whose compressed payloads are copied over when unchanged"""
+
+    def __init__(self, path: Path):
+        with ZipFile(path) as zfp:
+            self._infos = {info.filename: info for info in zfp.infolist()}
+        self._fp = path.open("rb")
+        self._lock = threading.Lock()
+
+    def payload(self, arcname: str, crc: int, size: int, method: int) -> bytes | None:
+        """raw payload of the same content compressed the same way, None if there is none"""
+        info = self._infos.get(arcname)
+        if info is None or (info.CRC, info.file_size, info.compress_type) != (crc, size, method):
+            return None
+        if info.flag_bits & 0x1:  # encrypted
+            return None
+        with self._lock:
+            self._fp.seek(info.header_offset)
+            header = self._fp.read(30)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            self._fp.seek(info.header_offset + 30 + name_length + extra_length)
+            return self._fp.read(info.compress_size)
+
+    def close(self):
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def entry(
+    arcname: str, data: bytes, *,
+    mtime: float | None = None, mode: int = 0o644, previous: PreviousArchive | None = None
+) -> ArchiveEntry:
+    """
+    compress `data` as member `arcname`
+
+    :param mtime: modification time, None for FIXED_DATE_TIME
+    :param previous: archive to copy the payload from if it holds the same content
+    """
+    crc = zlib.crc32(data)
+    method, level = policy(arcname)
+    payload = previous.payload(arcname, crc, len(data), method) if previous is not None else None
+    reused = payload is not None
+    if payload is None:
+        payload = data
+        if method == ZIP_DEFLATED:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+    return ArchiveEntry(
+        arcname=arcname,
+        method=method,
+        crc=crc,
+        size=len(data),
+        payload=payload,
+        date_time=FIXED_DATE_TIME if mtime is None else date_time(mtime),
+        mode=mode,
+        reused=reused,
+    )
+
+
+def compress(file: ArchiveFile, previous: PreviousArchive | None = None, reproducible: bool = False) -> ArchiveEntry:
+    """read and compress one file, runs in worker threads as zlib releases the GIL"""
+    if reproducible:
+        return entry(file.arcname, file.path.read_bytes(), previous=previous)
+    return entry(
+        file.arcname, file.path.read_bytes(),
+        mtime=file.stat.st_mtime, mode=file.stat.st_mode & 0o777, previous=previous,
+    )
+
+
+def compress_all(
+    files: Iterable[ArchiveFile], jobs: int, previous: PreviousArchive | None = None, reproducible: bool = False
+) -> Iterator[ArchiveEntry]:
+    """compress in `jobs` threads, yielding in the order of `files` with a bounded number in flight"""
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for file in files:
+            pending.append(executor.submit(compress, file, previous, reproducible))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ZipWriter:
+    """writes members with already compressed payloads, zip64 where sizes or offsets need it"""
+
+    def __init__(self, fp: BinaryIO):
+        self._fp = fp
+        self._central: list[bytes] = []
+        self._offset = 0
+
+    def write(self, entry: ArchiveEntry):
+        name = entry.arcname.encode("utf-8")
+        flags = 0 if entry.arcname.isascii() else _UTF8_FLAG
+        dos_time = entry.date_time[3] << 11 | entry.date_time[4] << 5 | entry.date_time[5] // 2
+        dos_date = (entry.date_time[0] - 1980) << 9 | entry.date_time[1] << 5 | entry.date_time[2]
+        compressed = len(entry.payload)
+
+        zip64 = entry.size >= _ZIP64_LIMIT or compressed >= _ZIP64_LIMIT
+        extra = struct.pack("<HHQQ", 0x0001, 16, entry.size, compressed) if zip64 else b""
+        version = 45 if zip64 else 20
+        header = struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034B50, version, flags, entry.method, dos_time, dos_date, entry.crc,
+            _MAX32 if zip64 else compressed,
+            _MAX32 if zip64 else entry.size,
+            len(name), len(extra),
+        )
+        self._fp.write(header + name + extra)
+        self._fp.write(entry.payload)
+
+        central_zip64 = zip64 or self._offset >= _ZIP64_LIMIT
+        central_extra = b""
+        if central_zip64:
+            fields = (entry.size, compressed, self._offset)
+            central_extra = struct.pack(f"<HH{len(fields)}Q", 0x0001, 8 * len(fields), *fields)
+        self._central.append(struct.pack(
+            "<IHHHHHHIIIHHHHHII",
+            0x02014B50, 3 << 8 | version, 45 if central_zip64 else 20, flags, entry.method, dos_time, dos_date,
+            entry.crc,
+            _MAX32 if central_zip64 else compressed,
+            _MAX32 if central_zip64 else entry.size,
+            len(name), len(central_extra), 0, 0, 0,
+            (0o100000 | entry.mode) << 16,
+            _MAX32 if central_zip64 else self._offset,
+        ) + name + central_extra)
+        self._offset += len(header) + len(name) + len(extra) + compressed
+
+    def close(self):
+        """write the central directory"""
+        start = self._offset
+        for record in self._central:
+            self._fp.write(record)
+        size = sum(len(record) for record in self._central)
+        count = len(self._central)
+
+        if count >= _ZIP64_COUNT_LIMIT or start >= _ZIP64_LIMIT or size >= _ZIP64_LIMIT:
+            end = start + size
+            self._fp.write(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, size, start))
+            self._fp.write(struct.pack("<IIQI", 0x07064B50, 0, end, 1))
+            count, size, start = _MAX16, _MAX32, _MAX32
+        self._fp.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, size, start, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+
+def pack(
+    fp: BinaryIO, files: Iterable[ArchiveFile], jobs: int,
+    previous: Path | None = None, reproducible: bool = False
+) -> Counter[bool]:
+    """
+    compress `files` in parallel and write them to `fp` in their order
+
+    :param previous: archive built before, unchanged members are copied from it instead of compressed again
+    :param reproducible: same time and mode for every member, so the same files give the same archive
+    :return: how many members were reused (True) or compressed (False)
+    """
+    counter = Counter()
+    with contextlib.ExitStack() as stack:
+        source = stack.enter_context(PreviousArchive(previous)) if previous is not None else None
+        writer = stack.enter_context(ZipWriter(fp))
+        for entry_ in compress_all(files, jobs, source, reproducible):
+            writer.write(entry_)
+            counter[entry_.reused] += 1
+    return counter
+
+
+__all__ = [
+    "ArchiveFile",
+    "ArchiveEntry",
+    "ZipWriter",
+    "PreviousArchive",
+    "FIXED_DATE_TIME",
+    "pack",
+]
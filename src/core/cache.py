@@ -0,0 +1,255 @@
+"""Records kept between runs to skip unchanged work."""
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable
+
+from src.codec import json_dump, json_load
+from src.config import DIR_CACHE, settings
+from src.log import logger
+
+
+def digest(filepath: Path) -> str | None:
+    """sha256 of a file's content, None if the file does not exist"""
+    try:
+        with filepath.open("rb") as fp:
+            return hashlib.file_digest(fp, "sha256").hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+class Manifest:
+    """persistent `key -> record` mapping stored as json in DIR_CACHE"""
+    logger = logger.bind(project_name="Manifest")
+
+    def __init__(self, name: str):
+        self._filepath = DIR_CACHE / f"{name}.json"
+        self._records: dict[str, dict] = self._load()
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with self.filepath.open("rb") as fp:
+                return json_load(fp)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            self.logger.bind(filepath=self.filepath).warning("Broken manifest, ignored")
+            return {}
+
+    def save(self):
+        """write to a temporary file first, a crash or another writer never leaves it half written"""
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.filepath.with_name(f"{self.filepath.name}.{os.getpid()}.tmp")
+        with tmp.open("wb") as fp:
+            json_dump(self.records, fp)
+        tmp.replace(self.filepath)
+        self.logger.bind(filepath=self.filepath).debug("Manifest saved")
+
+    def get(self, key: str) -> dict | None:
+        return self.records.get(key)
+
+    def set(self, key: str, record: dict):
+        self.records[key] = record
+
+    def pop(self, key: str) -> dict | None:
+        return self.records.pop(key, None)
+
+    @property
+    def filepath(self) -> Path:
+        return self._filepath
+
+    @property
+    def records(self) -> dict[str, dict]:
+        return self._records
+
+
+class ParsedCache:
+    """
+    in-process LRU of parsed files keyed on path + mtime/size, shared by stages of one run,
+    bounded by the total size of the files on disk
+    """
+    logger = logger.bind(project_name="ParsedCache")
+
+    def __init__(self, budget: int):
+        """
+        :param budget: bytes of files kept parsed, 0 disables the cache
+        """
+        self._budget = budget
+        self._size = 0
+        self._entries: OrderedDict[Path, tuple[tuple[int, int], Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filepath: Path, parse: Callable[[Path], Any], *, take: bool = False) -> Any:
+        """
+        :param filepath: file to read
+        :param parse: how to read it on a miss
+        :param take: remove the entry and hand it over, for callers that modify what they get
+        :return: parsed content
+        """
+        stat = filepath.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is not None and entry[0] == stamp:
+                if take:
+                    self._remove(filepath)
+                else:
+                    self._entries.move_to_end(filepath)
+                self.logger.bind(filepath=filepath).debug("Hit")
+                return entry[1]
+            if entry is not None:
+                self._remove(filepath)
+
+        value = parse(filepath)
+        if not take and 0 < stamp[1] <= self.budget:
+            with self._lock:
+                self._put(filepath, stamp, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _put(self, filepath: Path, stamp: tuple[int, int], value: Any):
+        if filepath in self._entries:
+            self._remove(filepath)
+        self._entries[filepath] = (stamp, value)
+        self._size += stamp[1]
+        while self._size > self.budget:
+            evicted, _ = self._entries.popitem(last=False)
+            self._size -= _[0][1]
+            self.logger.bind(filepath=evicted).debug("Evicted")
+
+    def _remove(self, filepath: Path):
+        stamp, _ = self._entries.pop(filepath)
+        self._size -= stamp[1]
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+
+class Snapshot:
+    """
+    parsed files pickled in DIR_CACHE/<name>, named by content hash so a changed file never hits a stale one,
+    an index of path -> mtime/size/hash spares hashing files which have not been touched
+    """
+    logger = logger.bind(project_name="Snapshot")
+
+    def __init__(self, name: str = "snapshot", *, enabled: bool = True):
+        self._name = name
+        self._directory = DIR_CACHE / name
+        self._enabled = enabled
+        self._index: Manifest | None = None
+        self._updates: dict[str, dict] = {}
+
+    def get(self, filepath: Path, parse: Callable[[Path], Any]) -> Any:
+        """
+        :param filepath: file to read
+        :param parse: how to read it when there is no snapshot
+        :return: parsed content
+        """
+        if not self.enabled:
+            return parse(filepath)
+
+        key = filepath.as_posix()
+        stat = filepath.stat()
+        record = self.index.get(key)
+        if record is not None and record["mtime"] == stat.st_mtime_ns and record["size"] == stat.st_size:
+            hash_ = record["digest"]
+        else:
+            hash_ = digest(filepath)
+
+        snapshot = self.directory / f"{hash_}{filepath.suffix}.pickle"
+        try:
+            with snapshot.open("rb") as fp:
+                value = pickle.load(fp)
+        except FileNotFoundError:
+            pass
+        except (pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            self.logger.bind(filepath=snapshot).warning("Broken snapshot, ignored")
+        else:
+            self.logger.bind(filepath=filepath).debug("Loaded from snapshot")
+            self._record(key, stat, hash_, record)
+            return value
+
+        value = parse(filepath)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = snapshot.with_name(f"{snapshot.name}.{os.getpid()}.tmp")
+        with tmp.open("wb") as fp:
+            pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(snapshot)
+        self.logger.bind(filepath=filepath).debug("Snapshot saved")
+        self._record(key, stat, hash_, record)
+        return value
+
+    def _record(self, key: str, stat: os.stat_result, hash_: str, record: dict | None):
+        """keep the index up to date, dropping the snapshot the file had before"""
+        if record is not None and record["mtime"] == stat.st_mtime_ns and record["size"] == stat.st_size:
+            return
+        if record is not None and record["digest"] != hash_:
+            for stale in self.directory.glob(f"{record['digest']}.*"):
+                stale.unlink(missing_ok=True)
+        record = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "digest": hash_}
+        self.index.set(key, record)
+        self._updates[key] = record
+
+    def updates(self) -> dict[str, dict]:
+        """index records changed in this process since the last call, handed back by workers to the parent"""
+        updates, self._updates = self._updates, {}
+        return updates
+
+    def merge(self, updates: dict[str, dict]):
+        """take in index records changed by a worker"""
+        for key, record in updates.items():
+            self.index.set(key, record)
+            self._updates[key] = record
+
+    def save(self):
+        """write the index once a stage is over, in the parent only"""
+        if self._updates:
+            self.index.save()
+            self._updates = {}
+
+    @property
+    def index(self) -> Manifest:
+        if self._index is None:
+            self._index = Manifest(f"{self._name}-index")
+        return self._index
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+
+parsed_cache = ParsedCache(settings.project.cache_memory * 1024 * 1024)
+snapshot = Snapshot(enabled=settings.project.snapshot)
+
+
+def in_worker(function: Callable[[Any], Any], argument: Any) -> tuple[Any, dict[str, dict]]:
+    """call `function` in a worker process, handing back what it changed in the snapshot index"""
+    return function(argument), snapshot.updates()
+
+
+__all__ = [
+    "digest",
+    "Manifest",
+    "ParsedCache",
+    "parsed_cache",
+    "Snapshot",
+    "snapshot",
+    "in_worker",
+]
@@ -1,16 +1,21 @@
 """Convert local rpg data to paratranz recognized format to upload"""
 
-import json
-import re
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 from typing import Callable
 
-from pydantic import BaseModel
-
-from src.config import DIR_CONVERT, DIR_DOWNLOAD, GAME_ROOT
+from src.codec import json_dump, json_load
+from src.config import DIR_CONVERT, DIR_DOWNLOAD, GAME_ROOT, settings
+from src.core.cache import Manifest, digest, in_worker, snapshot
+from src.core.download import DownloadView
 from src.core.project import Project
+from src.core.quest import tokenize_quests
+from src.core.segmenter import segment, text
 from src.log import logger
-from src.schema.enum import Code, FileType
+from src.schema.enum import DuplicatePolicy, FileType, ProcessStatus
 from src.schema.model import (
 	GameCommonEventModel,
 	GameItemModel,
@@ -25,55 +30,160 @@ from src.schema.model import (
 class Converter:
 	"""convert local files to paratranz format"""
 	logger = logger.bind(project_name="Convert")
+	"""bump when converted files change for the same input, invalidates the manifest"""
+	version = 1
 
-	def convert(self):
+	def __init__(
+		self,
+		duplicate_policy: DuplicatePolicy = settings.convert.duplicate_policy,
+		jobs: int = settings.convert.jobs,
+		incremental: bool = settings.project.workspace,
+		strict: bool = settings.project.strict,
+		pretty: bool = settings.convert.pretty,
+		download: DownloadView | None = None,
+	):
+		self._duplicate_policy = duplicate_policy
+		self._jobs = jobs or os.cpu_count() or 1
+		self._incremental = incremental
+		self._strict = strict
+		self._pretty = pretty
+		self._download = download or DownloadView()
+
+	def convert(self) -> Counter[ProcessStatus]:
 		self.logger.info("")
 		self.logger.info("======= CONVERT START =======")
-		for dir_ in {
-			GAME_ROOT / "www" / "data",
-			GAME_ROOT / "www" / "quest"
-		}:
-			for filepath in dir_.iterdir():
-				relative_filepath = filepath.relative_to(GAME_ROOT)
-				file_type = Project.categorize(relative_filepath)
-				if not file_type:
-					continue
+		filepaths = [
+			filepath
+			for dir_ in (
+				GAME_ROOT / "www" / "data",
+				GAME_ROOT / "www" / "quest"
+			)
+			for filepath in dir_.iterdir()
+		]
+
+		manifest, fingerprints = None, {}
+		if self.incremental:
+			manifest = Manifest("convert")
+			fingerprints = {filepath: self._fingerprint(filepath) for filepath in filepaths}
+			self._prune(manifest, filepaths)
+			filepaths = [
+				filepath
+				for filepath in filepaths
+				if not self._unchanged(manifest, filepath, fingerprints[filepath])
+			]
+			self.logger.debug(f"{len(filepaths)} of {len(fingerprints)} files changed since last run")
+
+		if self.jobs > 1:
+			self.logger.debug(f"Converting with {self.jobs} processes")
+			with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+				results = list(executor.map(in_worker, repeat(self._convert_file), filepaths))
+			statuses = [status for status, _ in results]
+			for _, updates in results:
+				snapshot.merge(updates)
+		else:
+			statuses = [self._convert_file(filepath) for filepath in filepaths]
+		snapshot.save()
+
+		if manifest is not None:
+			for filepath, status in zip(filepaths, statuses):
+				key = filepath.relative_to(GAME_ROOT).as_posix()
+				if status == ProcessStatus.SUCCESS:
+					manifest.set(key, fingerprints[filepath])
+				else:
+					manifest.pop(key)
+			manifest.save()
+
+		counter = Counter(status for status in statuses if status is not None)
+		counter[ProcessStatus.SKIPPED] = len(fingerprints) - len(filepaths) if manifest is not None else 0
+		self.logger.info(
+			f"Converted {counter[ProcessStatus.SUCCESS]} files, "
+			f"{counter[ProcessStatus.BLANK]} blank, "
+			f"{counter[ProcessStatus.FAILED]} failed, "
+			f"{counter[ProcessStatus.SKIPPED]} unchanged"
+		)
+		return counter
 
-				self.logger.bind(filepath=relative_filepath).debug("Converting file")
-				match file_type:
-					# JSON
-					case FileType.MAP:
-						models = self._convert_map(filepath, file_type)
-					case FileType.SYSTEM:
-						models = self._convert_system(filepath, file_type)
-					case FileType.ITEMS:
-						models = self._convert_items(filepath, file_type)
-					case FileType.SKILLS:
-						models = self._convert_skills(filepath, file_type)
-					case FileType.COMMON_EVENTS:
-						models = self._convert_common_events(filepath, file_type)
-					case FileType.MAPINFOS:
-						models = self._convert_map_infos(filepath, file_type)
-					# TXT
-					case FileType.QUEST:
-						models = self._convert_quest(filepath, file_type)
-					case _:
-						self.logger.bind(filepath=relative_filepath).error("Unknown file type when convert")
-						continue
+	def _fingerprint(self, filepath: Path) -> dict:
+		"""
+		everything a converted file depends on
 
-				if not models:
-					if models is None:
-						self.logger.bind(filepath=relative_filepath).warning("Converting file failed")
-					else:  # blank
-						self.logger.bind(filepath=relative_filepath).warning("Converting result is blank")
-					continue
+		:param filepath: game filepath
+		:return: manifest record
+		"""
+		relative_filepath = filepath.relative_to(GAME_ROOT)
+		return {
+			"original": digest(filepath),
+			"translation": self.download.digest(
+				DIR_DOWNLOAD / relative_filepath.parent / f"{relative_filepath.name}.json"
+			),
+			"version": f"{self.version}/{self.duplicate_policy.value}/{self.pretty}",
+		}
+
+	@staticmethod
+	def _unchanged(manifest: Manifest, filepath: Path, fingerprint: dict) -> bool:
+		"""inputs are the same as last run and its output is still there"""
+		relative_filepath = filepath.relative_to(GAME_ROOT)
+		if manifest.get(relative_filepath.as_posix()) != fingerprint:
+			return False
+		return (DIR_CONVERT / relative_filepath.parent / f"{relative_filepath.name}.json").exists()
+
+	def _prune(self, manifest: Manifest, filepaths: list[Path]):
+		"""drop outputs of game files which no longer exist"""
+		keys = {filepath.relative_to(GAME_ROOT).as_posix() for filepath in filepaths}
+		for key in [key for key in manifest.records if key not in keys]:
+			manifest.pop(key)
+			(DIR_CONVERT / f"{key}.json").unlink(missing_ok=True)
+			self.logger.bind(filepath=key).debug("Removed converted file of deleted game file")
+
+	def _convert_file(self, filepath: Path) -> ProcessStatus | None:
+		"""
+		convert one game file and write it to DIR_CONVERT, runs in worker processes when `jobs` > 1
 
-				datas = [_.model_dump() for _ in models]
-				(DIR_CONVERT / relative_filepath).parent.mkdir(parents=True, exist_ok=True)
-				converted_filepath = relative_filepath.parent / f"{relative_filepath.name}.json"
-				with (DIR_CONVERT / converted_filepath).open("w", encoding="utf-8") as fp:
-					json.dump(datas, fp, ensure_ascii=False, indent=2)
-				self.logger.bind(filepath=relative_filepath).debug("Converting file successfully.")
+		:param filepath: game filepath
+		:return: None if the file is not to be converted
+		"""
+		relative_filepath = filepath.relative_to(GAME_ROOT)
+		file_type = Project.categorize(relative_filepath)
+		if not file_type:
+			return None
+
+		self.logger.bind(filepath=relative_filepath).debug("Converting file")
+		match file_type:
+			# JSON
+			case FileType.MAP:
+				models = self._convert_map(filepath, file_type)
+			case FileType.SYSTEM:
+				models = self._convert_system(filepath, file_type)
+			case FileType.ITEMS:
+				models = self._convert_items(filepath, file_type)
+			case FileType.SKILLS:
+				models = self._convert_skills(filepath, file_type)
+			case FileType.COMMON_EVENTS:
+				models = self._convert_common_events(filepath, file_type)
+			case FileType.MAPINFOS:
+				models = self._convert_map_infos(filepath, file_type)
+			# TXT
+			case FileType.QUEST:
+				models = self._convert_quest(filepath, file_type)
+			case _:
+				self.logger.bind(filepath=relative_filepath).error("Unknown file type when convert")
+				return ProcessStatus.FAILED
+
+		if not models:
+			if models is None:
+				self.logger.bind(filepath=relative_filepath).warning("Converting file failed")
+				return ProcessStatus.FAILED
+			# blank
+			self.logger.bind(filepath=relative_filepath).warning("Converting result is blank")
+			return ProcessStatus.BLANK
+
+		datas = [_.model_dump() for _ in models]
+		(DIR_CONVERT / relative_filepath).parent.mkdir(parents=True, exist_ok=True)
+		converted_filepath = relative_filepath.parent / f"{relative_filepath.name}.json"
+		with (DIR_CONVERT / converted_filepath).open("wb") as fp:
+			json_dump(datas, fp, pretty=self.pretty)
+		self.logger.bind(filepath=relative_filepath).debug("Converting file successfully.")
+		return ProcessStatus.SUCCESS
 
 	def _convert_general(
 		self,
@@ -91,32 +201,73 @@ class Converter:
 			original: list | dict | str,
 			translation: list[ParatranzModel] | None,
 			translation_mapping: dict[str, ParatranzModel] | None,
+			translation_index: dict[str, ParatranzModel] | None,
 			translation_flag: bool,
 			**kwargs
 		:param kwargs:
 		:return:
 		"""
 		relative_filepath = filepath.relative_to(GAME_ROOT)
-		with filepath.open("r", encoding="utf-8") as fp:
-			original = Project.read(fp, type_)
+		original = Project.load(filepath, type_)
 
-		translation, translation_mapping = None, None
+		translation, translation_mapping, translation_index = None, None, None
 		filepath_translation = DIR_DOWNLOAD / relative_filepath.parent / f"{relative_filepath.name}.json"
-		if translation_flag := filepath_translation.exists():
+		if translation_flag := self.download.exists(filepath_translation):
 			self.logger.bind(filepath=relative_filepath).debug("Translation exists.")
-			with filepath_translation.open("r", encoding="utf-8") as fp:
-				translation: list[ParatranzModel] | None = [ParatranzModel.model_validate(_) for _ in json.load(fp)]
+			with self.download.open(filepath_translation) as fp:
+				translation: list[ParatranzModel] | None = [ParatranzModel.model_validate(_) for _ in json_load(fp)]
 				translation_mapping: dict[str, ParatranzModel] | None = {model.key: model for model in translation}
+				translation_index: dict[str, ParatranzModel] | None = self._index_translation(translation)
 
 		return process_function(
 			filepath=filepath,
 			original=original,
 			translation=translation,
 			translation_mapping=translation_mapping,
+			translation_index=translation_index,
 			translation_flag=translation_flag,
 			**kwargs
 		)
 
+	def _index_translation(self, translation: list[ParatranzModel]) -> dict[str, ParatranzModel]:
+		"""
+		original text -> downloaded entry, duplicated originals are resolved by `duplicate_policy`
+
+		:param translation: downloaded entries
+		:return: mapping of original text to the winning entry
+		"""
+		index: dict[str, ParatranzModel] = {}
+		for model in translation:
+			if model.original not in index:
+				index[model.original] = model
+			elif (
+				self.duplicate_policy == DuplicatePolicy.STAGE
+				and (model.stage or 0) > (index[model.original].stage or 0)
+			):
+				index[model.original] = model
+		return index
+
+	def _match_translation(
+		self,
+		key: str, original: str,
+		translation_mapping: dict[str, ParatranzModel],
+		translation_index: dict[str, ParatranzModel]
+	) -> ParatranzModel | None:
+		"""
+		find the downloaded entry of a unit by its original text
+
+		:param key: key of the unit
+		:param original: original text of the unit
+		:param translation_mapping: key -> entry
+		:param translation_index: original text -> entry
+		:return: matched entry, None if not translated before
+		"""
+		if self.duplicate_policy == DuplicatePolicy.KEY:
+			model = translation_mapping.get(key)
+			if model is not None and model.original == original:
+				return model
+		return translation_index.get(original)
+
 	def _convert_quest(self, filepath: Path, type_: FileType) -> list[ParatranzModel]:
 		"""
 		txt, <game_root>/www/js/plugins/Galv_QuestLog.js
@@ -131,18 +282,16 @@ class Converter:
 			translation_flag = kwargs["translation_flag"]
 			translation_mapping: dict[str, ParatranzModel] | None = kwargs["translation_mapping"]
 
-			pattern = re.compile(r"(<quest (\d+?):[\s\S]+?\|\d+?\|\d+?>[\s\S]+?</quest>)")
-			quests = re.findall(pattern, original)  # [(quest, idx)]
-
-			return [
-				ParatranzModel(
-					key=id_,
-					original=quest,
-					translation=(translation_mapping.get(id_, "") if translation_flag else "").translation if translation_mapping.get(id_) else "",  # noqa
-					stage=(translation_mapping.get(id_, "") if translation_flag else "").stage if translation_mapping.get(id_) else 0,
-				)
-				for quest, id_ in quests
-			]
+			models = []
+			for quest in tokenize_quests(original):
+				matched = translation_mapping.get(quest.id) if translation_flag else None
+				models.append(ParatranzModel(
+					key=quest.id,
+					original=quest.raw,
+					translation=matched.translation if matched else "",
+					stage=matched.stage if matched else 0,
+				))
+			return models
 
 		return self._convert_general(
 			filepath=filepath,
@@ -159,10 +308,10 @@ class Converter:
 		:return: array of ParatranzModel
 		"""
 		def _process(**kwargs):
-			original: GameMapModel = GameMapModel.model_validate(kwargs["original"])
+			original: GameMapModel = GameMapModel.load(kwargs["original"], strict=self.strict)
 			translation_flag = kwargs["translation_flag"]
-			translation: list[ParatranzModel] | None = kwargs["translation"]
 			translation_mapping: dict[str, ParatranzModel] | None = kwargs["translation_mapping"]
+			translation_index: dict[str, ParatranzModel] | None = kwargs["translation_index"]
 
 			display_name_translation = translation_mapping.get("displayName", "") if translation_flag else ""
 			display_name_translation = display_name_translation.translation if display_name_translation else ""
@@ -183,58 +332,22 @@ class Converter:
 				event_name = event.name
 
 				for idx_page, page in enumerate(event.pages):
-					flag_conversation, flag_choice = False, False
-					for idx_unit, unit in enumerate(page.list):
-						unit_code = unit.code
-						key = f"{event_id} | {event_name} | {idx_page} | {idx_unit} | {unit_code}"
-						if Code.DIALOG == unit_code:
-							original_value = unit.parameters[0]  # str
-							translation_value = [
-								model.translation
-								for model in translation
-								if model.original == original_value
-							] if translation_flag else ""
-							translation_value = translation_value[0] if translation_value else ""
-							if not flag_conversation:
-								flag_conversation = True
-								idx_ = idx_unit
-								context_conversation = ""
-								while Code.DIALOG == page.list[idx_:][0].code:
-									context_conversation += f"\n{page.list[idx_:][0].parameters[0]}"
-									idx_ += 1
-						elif Code.CHOICE == unit_code:
-							original_value = "\n".join(unit.parameters[0])  # list[str]
-							translation_value = [
-								model.translation
-								for model in translation
-								if model.original == original_value
-							] if translation_flag else ""
-							translation_value = translation_value[0] if translation_value else ""
-							if not flag_choice:
-								flag_choice = True
-								idx_ = idx_unit
-								context_choice = ""
-								while Code.CHOICE == page.list[idx_:][0].code:
-									context_choice += f"\n{' | '.join(page.list[idx_:][0].parameters[0])}"
-									idx_ += 1
-						else:
-							flag_conversation, flag_choice = False, False
-							continue
-						translation_stage = [
-							model.stage
-							for model in translation
-							if model.original == original_value
-						] if translation_flag else 0
-						translation_stage = translation_stage[0] if translation_stage else 0
-						model = ParatranzModel(
-							key=key,
-							original=original_value,
-							translation=translation_value,
-							context=context_conversation.strip() if Code.DIALOG == unit_code else context_choice.strip(),
-							stage=translation_stage
-						)
-						model.context = f'{display_name_translation or original.displayName}\n{model.context}'
-						models.append(model)
+					for block in segment(page.list):
+						for idx_unit, unit in zip(block.indices, block.units):
+							key = f"{event_id} | {event_name} | {idx_page} | {idx_unit} | {block.code}"
+							original_value = text(unit)
+							matched = self._match_translation(
+								key, original_value, translation_mapping, translation_index
+							) if translation_flag else None
+							models.append(
+								ParatranzModel(
+									key=key,
+									original=original_value,
+									translation=matched.translation if matched else "",
+									context=f'{display_name_translation or original.displayName}\n{block.context}',
+									stage=matched.stage if matched else 0
+								)
+							)
 
 			return models
 
@@ -254,68 +367,34 @@ class Converter:
 		"""
 		def _process(**kwargs):
 			original: list[GameCommonEventModel] = [
-				GameCommonEventModel.model_validate(_)
+				GameCommonEventModel.load(_, strict=self.strict)
 				for _ in kwargs["original"]
 				if _
 			]
 			translation_flag = kwargs["translation_flag"]
-			translation: list[ParatranzModel] | None = kwargs["translation"]
+			translation_mapping: dict[str, ParatranzModel] | None = kwargs["translation_mapping"]
+			translation_index: dict[str, ParatranzModel] | None = kwargs["translation_index"]
 
 			models = []
 			for idx, event in enumerate(original):
 				event_id = event.id
 				event_name = event.name
-				flag_conversation, flag_choice = False, False
-				for idx_unit, unit in enumerate(event.list):
-					if Code.DIALOG == unit.code:
-						original_value = unit.parameters[0]  # str
-						translation_value = [
-							model.translation
-							for model in translation
-							if model.original == original_value
-						] if translation_flag else ""
-						translation_value = translation_value[0] if translation_value else ""
-						if not flag_conversation:
-							flag_conversation = True
-							idx_ = idx_unit
-							context_conversation = ""
-							while Code.DIALOG == event.list[idx_:][0].code:
-								context_conversation += f"\n{event.list[idx_:][0].parameters[0]}"
-								idx_ += 1
-					elif Code.CHOICE == unit.code:
-						original_value = "\n".join(unit.parameters[0])  # list[str]
-						translation_value = [
-							model.translation
-							for model in translation
-							if model.original == original_value
-						] if translation_flag else ""
-						translation_value = translation_value[0] if translation_value else ""
-						if not flag_choice:
-							flag_choice = True
-							idx_ = idx_unit
-							context_choice = ""
-							while Code.CHOICE == event.list[idx_:][0].code:
-								context_choice += f"\n{' | '.join(event.list[idx_:][0].parameters[0])}"
-								idx_ += 1
-					else:
-						flag_conversation, flag_choice = False, False
-						continue
-
-					translation_stage = [
-						model.stage
-						for model in translation
-						if model.original == original_value
-					] if translation_flag else 0
-					translation_stage = translation_stage[0] if translation_stage else 0
-					models.append(
-						ParatranzModel(
-							key=f"{event_id} | {event_name} | {idx_unit} | {unit.code}",
-							original=original_value,
-							translation=translation_value,
-							context=context_conversation.strip() if Code.DIALOG == unit.code else context_choice.strip(),
-							stage=translation_stage
+				for block in segment(event.list):
+					for idx_unit, unit in zip(block.indices, block.units):
+						key = f"{event_id} | {event_name} | {idx_unit} | {block.code}"
+						original_value = text(unit)
+						matched = self._match_translation(
+							key, original_value, translation_mapping, translation_index
+						) if translation_flag else None
+						models.append(
+							ParatranzModel(
+								key=key,
+								original=original_value,
+								translation=matched.translation if matched else "",
+								context=block.context,
+								stage=matched.stage if matched else 0
+							)
 						)
-					)
 			return models
 
 		return self._convert_general(
@@ -332,10 +411,10 @@ class Converter:
 		:return: array of ParatranzModel
 		"""
 		def _process(**kwargs):
-			original: GameSystemModel = GameSystemModel.model_validate(kwargs["original"])
+			original: GameSystemModel = GameSystemModel.load(kwargs["original"], strict=self.strict)
 			translation_flag = kwargs["translation_flag"]
-			translation: list[ParatranzModel] | None = kwargs["translation"]
 			translation_mapping: dict[str, ParatranzModel] | None = kwargs["translation_mapping"]
+			translation_index: dict[str, ParatranzModel] | None = kwargs["translation_index"]
 
 			models = []
 			game_title_original = original.gameTitle
@@ -362,18 +441,11 @@ class Converter:
 
 					key_ = f"{key_prefix} | {idx_}"
 					original_ = item
-					translation_ = [
-						model.translation
-						for model in translation
-						if model.original == original_
-					] if translation_flag else ""
-					translation_ = translation_[0] if translation_ else ""
-					stage_ = [
-						model.stage
-						for model in translation
-						if model.original == original_
-					] if translation_flag else 0
-					stage_ = stage_[0] if stage_ else 0
+					matched_ = self._match_translation(
+						key_, original_, translation_mapping, translation_index
+					) if translation_flag else None
+					translation_ = matched_.translation if matched_ else ""
+					stage_ = matched_.stage if matched_ else 0
 					models_.append(ParatranzModel(key=key_, original=original_, translation=translation_, stage=stage_))
 				return models_
 
@@ -406,14 +478,15 @@ class Converter:
 			process_function=_process,
 		)
 
-	def _convert_items_or_skills(self, filepath: Path, type_: FileType, *, Model: type[BaseModel]) -> list[ParatranzModel]:  # noqa
+	def _convert_items_or_skills(self, filepath: Path, type_: FileType, *, Model: type[GameItemModel | GameSkillModel]) -> list[ParatranzModel]:  # noqa
 		def _process(**kwargs):
-			original: list[Model] = [Model.model_validate(_) for _ in kwargs["original"] if _]
+			original: list[Model | None] = [Model.load(_, strict=self.strict) if _ else None for _ in kwargs["original"]]
 			translation_flag = kwargs["translation_flag"]
 			translation_mapping: dict[str, ParatranzModel] | None = kwargs["translation_mapping"]
 
 			models = []
-			for idx, element in enumerate(original):
+			for idx in Project.index_by_id(original, kwargs["filepath"]).values():
+				element = original[idx]
 				if not any((element.name, element.description)):
 					continue
 
@@ -484,7 +557,7 @@ class Converter:
 		"""
 		def _process(**kwargs):
 			original: list[GameMapInfoModel | None] = [
-				GameMapInfoModel.model_validate(_)
+				GameMapInfoModel.load(_, strict=self.strict)
 				if _ is not None else None
 				for _ in kwargs["original"]
 			]  # 一般情况下, original 比 translation 内容多 (length 112)
@@ -492,10 +565,8 @@ class Converter:
 			translation_mapping: dict[str, ParatranzModel] | None = kwargs["translation_mapping"]  # length 108
 
 			models = []
-			for idx, info in enumerate(original):
-				if info is None:
-					continue
-
+			for idx in Project.index_by_id(original, kwargs["filepath"]).values():
+				info = original[idx]
 				translation_value = translation_mapping.get(info.id.__str__(), "") if translation_flag else ""
 				translation_value = translation_value.translation if translation_value else ""
 				stage_value = translation_mapping.get(info.id.__str__(), 0) if translation_flag else 0
@@ -510,6 +581,30 @@ class Converter:
 			process_function=_process,
 		)
 
+	@property
+	def duplicate_policy(self) -> DuplicatePolicy:
+		return self._duplicate_policy
+
+	@property
+	def jobs(self) -> int:
+		return self._jobs
+
+	@property
+	def incremental(self) -> bool:
+		return self._incremental
+
+	@property
+	def strict(self) -> bool:
+		return self._strict
+
+	@property
+	def download(self) -> DownloadView:
+		return self._download
+
+	@property
+	def pretty(self) -> bool:
+		return self._pretty
+
 
 __all__ = [
 	"Converter",
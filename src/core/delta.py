@@ -0,0 +1,112 @@
+"""Delta archives holding only what changed since a previous release."""
+import json
+import re
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterable
+from zipfile import ZipFile
+
+from src.core.archive import ArchiveFile, ZipWriter, entry
+from src.core.delta_apply import MANIFEST, PATCHES, patch
+from src.log import logger
+
+"""json files from this size on are diffed against their previous version instead of shipped whole"""
+DIFF_MIN_SIZE = 64 * 1024
+"""smallest chunk matched between versions"""
+CHUNK_MIN_SIZE = 1024
+"""chunks end after these, so they follow the structure of compact json and resync after an edit"""
+_BOUNDARY = re.compile(rb"},|],|\n")
+
+_logger = logger.bind(project_name="Delta")
+
+
+def chunk(data: bytes) -> list[tuple[int, int]]:
+    """content-defined spans of `data`, each ending at the first boundary past CHUNK_MIN_SIZE"""
+    spans, start = [], 0
+    for match in _BOUNDARY.finditer(data):
+        if match.end() - start >= CHUNK_MIN_SIZE:
+            spans.append((start, match.end()))
+            start = match.end()
+    if start < len(data):
+        spans.append((start, len(data)))
+    return spans
+
+
+def diff(base: bytes, data: bytes) -> tuple[list[list], bytes]:
+    """
+    describe `data` as chunks copied from `base` plus inserted bytes
+
+    :return: ops for `delta_apply.patch`, inserted bytes
+    """
+    index: dict[bytes, int] = {}
+    for start, end in chunk(base):
+        index.setdefault(base[start:end], start)
+
+    ops, inserted = [], bytearray()
+    for start, end in chunk(data):
+        piece = data[start:end]
+        offset = index.get(piece)
+        if offset is not None:
+            if ops and ops[-1][0] == "copy" and ops[-1][1] + ops[-1][2] == offset:
+                ops[-1][2] += len(piece)
+            else:
+                ops.append(["copy", offset, len(piece)])
+        else:
+            if ops and ops[-1][0] == "insert":
+                ops[-1][2] += len(piece)
+            else:
+                ops.append(["insert", len(inserted), len(piece)])
+            inserted += piece
+    return ops, bytes(inserted)
+
+
+def build(fp: BinaryIO, files: Iterable[ArchiveFile], base: Path) -> dict:
+    """
+    write a delta archive turning release `base` into `files`,
+    with an applier script and reproducible members
+
+    :return: the manifest written as MANIFEST
+    """
+    manifest = {"base": base.name, "files": [], "patched": {}, "deleted": []}
+    members: dict[str, bytes] = {}
+    with ZipFile(base) as zfp:
+        infos = {info.filename: info for info in zfp.infolist() if not info.is_dir()}
+        names = set()
+        for file in files:
+            names.add(file.arcname)
+            data = file.path.read_bytes()
+            crc = zlib.crc32(data)
+            info = infos.get(file.arcname)
+            if info is not None and (info.CRC, info.file_size) == (crc, len(data)):
+                continue
+
+            if info is not None and file.arcname.endswith(".json") and len(data) >= DIFF_MIN_SIZE:
+                base_data = zfp.read(info)
+                ops, inserted = diff(base_data, data)
+                if len(inserted) < len(data) // 2 and patch(base_data, ops, inserted) == data:
+                    manifest["patched"][file.arcname] = {"base_crc": info.CRC, "crc": crc, "ops": ops}
+                    members[f"{PATCHES}{file.arcname}"] = inserted
+                    _logger.bind(filepath=file.arcname).debug(f"Diffed, {len(inserted)} of {len(data)} bytes shipped")
+                    continue
+
+            manifest["files"].append(file.arcname)
+            members[file.arcname] = data
+        manifest["deleted"] = sorted(name for name in infos if name not in names)
+
+    members[MANIFEST] = json.dumps(manifest, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    members["apply_delta.py"] = Path(__file__).with_name("delta_apply.py").read_bytes()
+    with ZipWriter(fp) as writer:
+        for arcname in sorted(members):
+            writer.write(entry(arcname, members[arcname]))
+
+    _logger.info(
+        f"{len(manifest['files'])} files changed, "
+        f"{len(manifest['patched'])} patched, "
+        f"{len(manifest['deleted'])} deleted since {base.name}"
+    )
+    return manifest
+
+
+__all__ = [
+    "build",
+]
@@ -0,0 +1,63 @@
+"""
+Apply a delta archive onto a game already patched with the release it was made against.
+Standalone, shipped in every delta archive as `apply_delta.py`.
+
+usage: python apply_delta.py <delta archive> <game root>
+"""
+import json
+import sys
+import zlib
+from pathlib import Path
+from zipfile import ZipFile
+
+"""what the delta does, see `src/core/delta.py`"""
+MANIFEST = "delta.json"
+"""inserted bytes of patched files"""
+PATCHES = "patches/"
+
+
+def patch(base: bytes, ops: list[list], inserted: bytes) -> bytes:
+    """rebuild a file from `["copy", offset, length]` of `base` and `["insert", offset, length]` of `inserted`"""
+    result = bytearray()
+    for op, offset, length in ops:
+        result += (base if op == "copy" else inserted)[offset:offset + length]
+    return bytes(result)
+
+
+def apply(archive: Path, root: Path):
+    with ZipFile(archive) as zfp:
+        manifest = json.loads(zfp.read(MANIFEST))
+
+        # check every base before touching anything
+        bases = {}
+        for name, info in manifest["patched"].items():
+            filepath = root / name
+            base = filepath.read_bytes() if filepath.exists() else b""
+            if zlib.crc32(base) != info["base_crc"]:
+                raise SystemExit(f"{name} is not the one of {manifest['base']}, install the full release instead")
+            bases[name] = base
+
+        for name in manifest["deleted"]:
+            (root / name).unlink(missing_ok=True)
+
+        for name in manifest["files"]:
+            (root / name).parent.mkdir(parents=True, exist_ok=True)
+            (root / name).write_bytes(zfp.read(name))
+
+        for name, info in manifest["patched"].items():
+            data = patch(bases[name], info["ops"], zfp.read(f"{PATCHES}{name}"))
+            if zlib.crc32(data) != info["crc"]:
+                raise SystemExit(f"{name} is broken after patching, install the full release instead")
+            (root / name).write_bytes(data)
+
+    print(
+        f"{len(manifest['files'])} files written, "
+        f"{len(manifest['patched'])} patched, "
+        f"{len(manifest['deleted'])} deleted"
+    )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        raise SystemExit(__doc__)
+    apply(Path(sys.argv[1]), Path(sys.argv[2]))
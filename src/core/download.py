@@ -0,0 +1,154 @@
+"""Translated files downloaded from Paratranz, extracted or still zipped."""
+import hashlib
+import os
+import shutil
+import time
+import zlib
+from pathlib import Path
+from typing import IO
+from zipfile import ZipFile, ZipInfo
+
+from src.config import DIR_CACHE, DIR_DOWNLOAD, settings
+from src.log import logger
+
+"""artifact exported by Paratranz, kept between runs to download it only when it changes"""
+ARTIFACT = DIR_CACHE / "paratranz_export.zip"
+"""folder of translated files in the artifact"""
+ARTIFACT_ROOT = "utf8"
+
+
+def extract(
+    archive: Path = ARTIFACT, destination: Path = DIR_DOWNLOAD, by_hash: bool = settings.project.copy_by_hash
+) -> int:
+    """
+    copy translated files out of the artifact, nothing else is extracted,
+    files already extracted are kept and those no longer in the artifact removed
+
+    :param by_hash: compare extracted files by crc instead of size and mtime
+    :return: how many files were written
+    """
+    written = 0
+    with ZipFile(archive) as zfp:
+        members = _members(zfp)
+        for relative, info in members.items():
+            filepath = destination / relative
+            if _extracted(filepath, info, by_hash):
+                continue
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            filepath.unlink(missing_ok=True)
+            with zfp.open(info) as src, filepath.open("wb") as dst:
+                shutil.copyfileobj(src, dst)
+            mtime = _mtime(info)
+            os.utime(filepath, (mtime, mtime))
+            written += 1
+
+    if destination.exists():
+        for filepath in [filepath for filepath in destination.glob("**/*") if not filepath.is_dir()]:
+            if filepath.relative_to(destination).as_posix() not in members:
+                filepath.unlink()
+    return written
+
+
+def _mtime(info: ZipInfo) -> float:
+    return time.mktime((*info.date_time, 0, 0, -1))
+
+
+def _extracted(filepath: Path, info: ZipInfo, by_hash: bool) -> bool:
+    """`filepath` was extracted from `info` before"""
+    try:
+        stat = filepath.stat()
+    except FileNotFoundError:
+        return False
+    if stat.st_size != info.file_size:
+        return False
+    if by_hash:
+        crc = 0
+        with filepath.open("rb") as fp:
+            while chunk := fp.read(1024 * 1024):
+                crc = zlib.crc32(chunk, crc)
+        return crc == info.CRC
+    return stat.st_mtime == _mtime(info)
+
+
+def _members(zfp: ZipFile) -> dict[str, ZipInfo]:
+    """relative path in DIR_DOWNLOAD -> translated file in the artifact"""
+    prefix = f"{ARTIFACT_ROOT}/"
+    return {
+        info.filename.removeprefix(prefix): info
+        for info in zfp.infolist()
+        if info.filename.startswith(prefix) and not info.is_dir()
+    }
+
+
+class DownloadView:
+    """
+    files of DIR_DOWNLOAD, addressed by their paths in it,
+    read from the directory or straight out of the artifact when it was not extracted
+    """
+    logger = logger.bind(project_name="Download")
+
+    def __init__(self, extracted: bool = settings.paratranz.extract, archive: Path = ARTIFACT):
+        self._extracted = extracted
+        self._archive = archive
+        self._zipfile: ZipFile | None = None
+        self._members: dict[str, ZipInfo] | None = None
+
+    def __getstate__(self) -> dict:
+        """open zip files do not go to worker processes, they reopen it"""
+        return {**self.__dict__, "_zipfile": None, "_members": None}
+
+    def glob(self) -> list[Path]:
+        """every downloaded file"""
+        if self.extracted:
+            DIR_DOWNLOAD.mkdir(exist_ok=True, parents=True)
+            return [filepath for filepath in DIR_DOWNLOAD.glob("**/*") if not filepath.is_dir()]
+        return [DIR_DOWNLOAD / relative for relative in self.members]
+
+    def exists(self, filepath: Path) -> bool:
+        if self.extracted:
+            return filepath.exists()
+        return self._relative(filepath) in self.members
+
+    def open(self, filepath: Path) -> IO[bytes]:
+        if self.extracted:
+            return filepath.open("rb")
+        return self.zipfile.open(self.members[self._relative(filepath)])
+
+    def digest(self, filepath: Path) -> str | None:
+        """sha256 of a file's content, None if the file does not exist"""
+        if not self.exists(filepath):
+            return None
+        with self.open(filepath) as fp:
+            return hashlib.file_digest(fp, "sha256").hexdigest()
+
+    @staticmethod
+    def _relative(filepath: Path) -> str:
+        return filepath.relative_to(DIR_DOWNLOAD).as_posix()
+
+    @property
+    def zipfile(self) -> ZipFile:
+        if self._zipfile is None:
+            self._zipfile = ZipFile(self.archive)
+            self.logger.bind(filepath=self.archive).debug("Reading translated files from artifact")
+        return self._zipfile
+
+    @property
+    def members(self) -> dict[str, ZipInfo]:
+        if self._members is None:
+            self._members = _members(self.zipfile)
+        return self._members
+
+    @property
+    def extracted(self) -> bool:
+        return self._extracted
+
+    @property
+    def archive(self) -> Path:
+        return self._archive
+
+
+__all__ = [
+    "ARTIFACT",
+    "DownloadView",
+    "extract",
+]
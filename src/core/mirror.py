@@ -0,0 +1,112 @@
+"""Files placed from one tree into another by copy or link, skipping those already in place."""
+import os
+import shutil
+from collections import Counter
+from pathlib import Path
+from typing import Callable
+
+from src.config import settings
+from src.core.cache import digest
+from src.log import logger
+from src.schema.enum import CopyStrategy
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+"""ioctl cloning a whole file on copy-on-write filesystems of Linux"""
+FICLONE = 0x40049409
+
+_logger = logger.bind(project_name="Mirror")
+
+
+def identical(source: Path, destination: Path, strategy: CopyStrategy, by_hash: bool = False) -> bool:
+    """`destination` already holds what placing `source` there would give, by size and mtime or by hash"""
+    try:
+        if strategy == CopyStrategy.SYMLINK:
+            return destination.is_symlink() and Path(os.readlink(destination)) == source.absolute()
+        if destination.is_symlink():
+            return False
+        if strategy == CopyStrategy.HARDLINK and os.path.samefile(source, destination):
+            return True
+        source_stat, destination_stat = source.stat(), destination.stat()
+    except OSError:
+        return False
+
+    if source_stat.st_size != destination_stat.st_size:
+        return False
+    if by_hash:
+        return digest(source) == digest(destination)
+    return source_stat.st_mtime_ns == destination_stat.st_mtime_ns
+
+
+def _reflink(source: Path, destination: Path):
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with source.open("rb") as src, destination.open("wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(source, destination)
+
+
+def place(
+    source: Path, destination: Path,
+    strategy: CopyStrategy = settings.project.copy_strategy, by_hash: bool = settings.project.copy_by_hash
+) -> CopyStrategy | None:
+    """
+    put `source` at `destination`, copying it where `strategy` is not supported
+
+    :return: strategy actually used, None if `destination` was already identical
+    """
+    if identical(source, destination, strategy, by_hash):
+        return None
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.unlink(missing_ok=True)  # never write through a link into its source
+    try:
+        match strategy:
+            case CopyStrategy.HARDLINK:
+                os.link(source, destination)
+                return strategy
+            case CopyStrategy.REFLINK:
+                _reflink(source, destination)
+                return strategy
+            case CopyStrategy.SYMLINK:
+                destination.symlink_to(source.absolute())
+                return strategy
+    except OSError as e:
+        _logger.bind(filepath=destination).debug(f"Cannot {strategy.value}, copying instead: {e}")
+        destination.unlink(missing_ok=True)
+    shutil.copy2(source, destination)
+    return CopyStrategy.COPY
+
+
+def mirror(
+    source: Path, destination: Path,
+    strategy: CopyStrategy = settings.project.copy_strategy, by_hash: bool = settings.project.copy_by_hash,
+    ignore: Callable[[str, list[str]], set[str]] | None = None,
+) -> Counter[CopyStrategy | None]:
+    """
+    place every file of directory `source` into directory `destination`, other files there are left alone
+
+    :param ignore: as for `shutil.copytree`, names in a directory which are not placed
+    :return: how many files were placed by each strategy, None for those already in place
+    """
+    counter = Counter()
+    for root, _, filenames in os.walk(source):
+        relative = Path(root).relative_to(source)
+        ignored = ignore(root, filenames) if ignore is not None else set()
+        for filename in filenames:
+            if filename in ignored:
+                continue
+            used = place(Path(root) / filename, destination / relative / filename, strategy, by_hash)
+            if strategy != CopyStrategy.COPY and used == CopyStrategy.COPY:
+                strategy = CopyStrategy.COPY  # the rest lies on the same filesystems, do not try again
+            counter[used] += 1
+    return counter
+
+
+__all__ = [
+    "mirror",
+    "place",
+]
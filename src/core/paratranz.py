@@ -1,81 +1,381 @@
+import asyncio
 import contextlib
-import shutil
+import hashlib
+import importlib.util
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from zipfile import ZipFile, BadZipFile
+from typing import Any
+from zipfile import BadZipFile
 
 import httpx
 from loguru._logger import Logger
 
-from src.config import settings
+from src.codec import json_loads
+from src.config import DIR_CONVERT, DIR_DOWNLOAD, settings
+from src.core.cache import Manifest
+from src.core.download import ARTIFACT, extract
 from src.log import logger
-from src.schema.model import ParatranzProjectModel
+from src.schema.enum import SyncStatus
+from src.schema.model import ParatranzArtifactModel, ParatranzFileModel, ParatranzProjectModel
+
+"""HTTP/2 needs the optional `h2` package (`pip install httpx[http2]`)"""
+HTTP2 = importlib.util.find_spec("h2") is not None
+"""statuses worth retrying, 429 is rate limited"""
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+"""seconds cached responses are served without asking Paratranz"""
+TTL_PROJECT = 5 * 60
+TTL_FILES = 60
+TTL_MEMBERS = 24 * 60 * 60
+"""bytes written at a time when downloading"""
+CHUNK_SIZE = 1 << 16
+"""bytes between download progress logs"""
+PROGRESS_STEP = 8 << 20
+"""longest wait between two checks of the export"""
+MAX_EXPORT_INTERVAL = 30
 
 
 class Paratranz:
-    def __init__(self, client: httpx.Client = httpx.Client()):
+    def __init__(self, client: httpx.Client | None = None):
         self._logger = logger.bind(project_name="Paratranz")
-        self._client = client
+        self._client = client or httpx.Client(timeout=settings.paratranz.timeout)
         self._base_url = "https://paratranz.cn/api"
         self._headers = {
             "Authorization": settings.paratranz.token,
             "user-agent": settings.project.user_agent,
         }
         self._project_id = settings.paratranz.project_id
+        self._export_wait: float | None = None
+        self._responses = Manifest("paratranz-responses")
         self.logger.info("")
         self.logger.info("======= PARATRANZ START =======")
 
-    def _update_file(self, file: str, fileid: int):
+    def _async_client(self) -> httpx.AsyncClient:
+        """pooled, keep-alive client for concurrent requests"""
+        return httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=settings.paratranz.timeout,
+            limits=httpx.Limits(
+                max_connections=settings.paratranz.concurrency,
+                max_keepalive_connections=settings.paratranz.concurrency,
+            ),
+        )
+
+    async def _request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        """send a request, retrying on rate limits, server errors and network errors"""
+        for attempt in range(settings.paratranz.retries + 1):
+            try:
+                response = await client.request(method, url, headers=self.headers, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == settings.paratranz.retries:
+                    raise
+                delay = 2 ** attempt
+                self.logger.bind(filepath=url).warning(f"{e!r}, retrying in {delay}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == settings.paratranz.retries:
+                    return response.raise_for_status()
+                delay = self._retry_after(response) or 2 ** attempt
+                self.logger.bind(filepath=url).warning(f"HTTP {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> float | None:
+        """seconds to wait told by `Retry-After`, either seconds or an HTTP date"""
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        with contextlib.suppress(ValueError):
+            return max(float(value), 0)
+        with contextlib.suppress(TypeError, ValueError):
+            return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+        return None
+
+    async def _update_file(self, client: httpx.AsyncClient, filepath: Path, fileid: int):
         url = f"{self.base_url}/projects/{self.project_id}/files/{fileid}"
-        headers = {**self.headers, 'Content-Type': 'multipart/form-data'}
-        data = {"file": bytearray(file, "utf-8")}
-        response = self.client.post(url, headers=headers, data=data)
-        self.logger.bind(filepath=response.json()).success("Updated file successfully")
+        files = {"file": (filepath.name, filepath.read_bytes(), "application/json")}
+        await self._request(client, "POST", url, files=files)
+        self.logger.bind(filepath=filepath).success("Updated file successfully")
 
-    def _create_file(self, file: str, path: Path):
+    async def _create_file(self, client: httpx.AsyncClient, filepath: Path, path: Path):
         url = f"{self.base_url}/projects/{self.project_id}/files"
-        headers = {**self.headers, 'Content-Type': 'multipart/form-data'}
-        data = {"file": bytearray(file, "utf-8"), "path": path.__str__()}
-        response = self.client.post(url, headers=headers, data=data)
-        self.logger.bind(filepath=response.json()).success("Created file successfully")
+        files = {"file": (filepath.name, filepath.read_bytes(), "application/json")}
+        data = {"path": path.as_posix()}
+        await self._request(client, "POST", url, files=files, data=data)
+        self.logger.bind(filepath=filepath).success("Created file successfully")
 
-    def get_project_info(self) -> ParatranzProjectModel:
-        url = f"{self.base_url}/projects/{self.project_id}"
-        response = self.client.get(url, headers=self.headers)
+    async def _get_files(self, client: httpx.AsyncClient) -> list[ParatranzFileModel]:
+        url = f"{self.base_url}/projects/{self.project_id}/files"
+        response = await self._request(client, "GET", url)
+        self.responses.set("/files", {"time": time.time(), "data": response.json()})
+        return [ParatranzFileModel.model_validate(_) for _ in response.json()]
+
+    def sync_files(self, *, force: bool = False) -> Counter[SyncStatus]:
+        """
+        upload converted files concurrently, comparing them with what was pushed last time
+
+        :param force: upload every file regardless of the last push
+        :return: how many files were created / updated / skipped / failed
+        """
+        return asyncio.run(self._sync_files(force=force))
+
+    async def _sync_files(self, *, force: bool = False) -> Counter[SyncStatus]:
+        self.logger.info("Starting to upload converted files...")
+        filepaths = [filepath for filepath in DIR_CONVERT.glob("**/*.json") if filepath.is_file()]
+        semaphore = asyncio.Semaphore(settings.paratranz.concurrency)
+        manifest = Manifest("paratranz-push")
+
+        async with self._async_client() as client:
+            remote = {file.name: file for file in await self._get_files(client)}
+
+            async def _sync(filepath: Path) -> SyncStatus:
+                key = filepath.relative_to(DIR_CONVERT).as_posix()
+                content = filepath.read_bytes()
+                record = {"digest": hashlib.sha256(content).hexdigest()}
+                previous = None if force else manifest.get(key)
+                file = remote.get(key)
+
+                if file is not None and previous is not None:
+                    if previous["digest"] == record["digest"]:
+                        return SyncStatus.SKIPPED
+                    record["keys"] = self._key_digests(content)
+                    if previous.get("keys") == record["keys"]:  # only translations changed, which come from Paratranz
+                        manifest.set(key, record)
+                        return SyncStatus.SKIPPED
+                    changed = sum(previous["keys"].get(k) != v for k, v in record["keys"].items())
+                    removed = len(previous["keys"].keys() - record["keys"].keys())
+                    self.logger.bind(filepath=key).debug(f"{changed} strings changed, {removed} removed")
+
+                record.setdefault("keys", self._key_digests(content))
+                async with semaphore:
+                    try:
+                        if file is not None:
+                            await self._update_file(client, filepath, file.id)
+                            status = SyncStatus.UPDATED
+                        else:
+                            await self._create_file(client, filepath, Path(key).parent)
+                            status = SyncStatus.CREATED
+                    except httpx.HTTPError as e:
+                        self.logger.bind(filepath=key).error(f"Error uploading file: {e!r}")
+                        manifest.pop(key)
+                        return SyncStatus.FAILED
+                manifest.set(key, record)
+                return status
+
+            counter = Counter(await asyncio.gather(*(_sync(filepath) for filepath in filepaths)))
+
+        manifest.save()
+        self.responses.pop("/files")  # changed by this push
+        self.responses.save()
+        self.logger.info(
+            f"Created {counter[SyncStatus.CREATED]} files, "
+            f"updated {counter[SyncStatus.UPDATED]}, "
+            f"{counter[SyncStatus.SKIPPED]} unchanged, "
+            f"{counter[SyncStatus.FAILED]} failed"
+        )
+        return counter
+
+    @staticmethod
+    def _key_digests(content: bytes) -> dict[str, str]:
+        """key -> digest of what Paratranz takes from an uploaded entry, translations excluded"""
+        return {
+            entry["key"]: hashlib.blake2b(
+                f"{entry['original']}\0{entry.get('context', '')}".encode("utf-8"),
+                digest_size=8
+            ).hexdigest()
+            for entry in json_loads(content)
+        }
+
+    def _cached_get(self, path: str, ttl: float, *, refresh: bool = False) -> Any:
+        """
+        GET a json endpoint through the on-disk response cache
+
+        :param path: endpoint path under the project, "" for the project itself
+        :param ttl: seconds a cached response is served without asking Paratranz
+        :param refresh: ask Paratranz even if the cached response is fresh
+        :return: response json, the last known one in offline mode or when Paratranz is unreachable
+        """
+        record = self.responses.get(path)
+        if record is not None and (
+            settings.paratranz.offline
+            or (not refresh and time.time() - record["time"] < ttl)
+        ):
+            return record["data"]
+        if settings.paratranz.offline:
+            raise LookupError(f"No cached response of {path!r} in offline mode")
+
+        url = f"{self.base_url}/projects/{self.project_id}{path}"
+        try:
+            response = self.client.get(url, headers=self.headers).raise_for_status()
+        except httpx.TransportError as e:
+            if record is None:
+                raise
+            self.logger.bind(filepath=path).warning(f"{e!r}, using response cached at {time.ctime(record['time'])}")
+            return record["data"]
+
+        data = response.json()
+        self.responses.set(path, {"time": time.time(), "data": data})
+        self.responses.save()
+        return data
+
+    def get_project_info(self, *, refresh: bool = False) -> ParatranzProjectModel:
+        data = self._cached_get("", TTL_PROJECT, refresh=refresh)
         self.logger.success("Get project info successfully")
-        return ParatranzProjectModel.model_validate(response.json())
+        return ParatranzProjectModel.model_validate(data)
+
+    def get_files(self, *, refresh: bool = False) -> list[ParatranzFileModel]:
+        data = self._cached_get("/files", TTL_FILES, refresh=refresh)
+        return [ParatranzFileModel.model_validate(_) for _ in data]
+
+    def get_members(self, *, refresh: bool = False) -> list[dict]:
+        return self._cached_get("/members", TTL_MEMBERS, refresh=refresh)
 
-    def download(self):
+    def download(self, *, force: bool = False) -> bool:
+        """
+        download translated files, skipping what has not changed since the last download
+
+        :param force: export and download even if nothing seems to have changed
+        :return: False if there are no remote changes
+        """
         self.logger.info("Starting to download translated files...")
-        (settings.filepath.root / settings.filepath.tmp).mkdir(parents=True, exist_ok=True)
-        (settings.filepath.root / settings.filepath.download).mkdir(parents=True, exist_ok=True)
-        with contextlib.suppress(httpx.TimeoutException):
+        ARTIFACT.parent.mkdir(parents=True, exist_ok=True)
+        DIR_DOWNLOAD.mkdir(parents=True, exist_ok=True)
+        manifest = Manifest("paratranz-artifact")
+        record = manifest.get("artifact") or {}
+        if not ARTIFACT.exists():
+            record = {}
+
+        if settings.paratranz.offline:
+            if not record:
+                raise LookupError("No artifact downloaded before, cannot work offline")
+            changed = False
+            self.logger.info("Offline, using the artifact downloaded last time")
+        else:
+            project = self.get_project_info(refresh=True)
+            state = {"updatedAt": project.updatedAt, "stats": project.stats.model_dump()}
+            if not force and record and project.updatedAt is not None and record.get("project") == state:
+                changed = False
+                self.logger.info("Project not updated since last download")
+            else:
+                self._export()
+                if force:  # download unconditionally, the fresh validators are still recorded
+                    for key in ("etag", "lastModified", "digest"):
+                        record.pop(key, None)
+                changed = self._download_artifacts(record)
+                record["project"] = state
+
+        if settings.paratranz.extract:
+            if changed or not any(DIR_DOWNLOAD.iterdir()):
+                self._extract_artifacts()
+        else:
+            self.logger.info("Translated files will be read from the artifact")
+
+        manifest.set("artifact", record)
+        manifest.save()
+        if changed:
+            self.logger.success("Download completes.")
+        else:
+            self.logger.success("No remote changes.")
+        return changed
+
+    def _export(self) -> ParatranzArtifactModel:
+        """trigger an export and wait until it is ready, backing off exponentially"""
+        previous = self._get_artifact()
+        start = time.monotonic()
+        with contextlib.suppress(httpx.TimeoutException):  # exporting goes on after the request times out
             self._trigger_export()
-        self._download_artifacts()
-        self._extract_artifacts()
-        self.logger.success("Download completes.")
+
+        deadline = start + settings.paratranz.export_timeout
+        interval = settings.paratranz.export_interval
+        while True:
+            artifact = self._get_artifact()
+            if artifact is not None and (previous is None or artifact.createdAt != previous.createdAt):
+                self._export_wait = time.monotonic() - start
+                self.logger.info(f"Export ready after {self.export_wait:.1f}s")
+                return artifact
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._export_wait = time.monotonic() - start
+                self.logger.error(f"Export not ready after {self.export_wait:.1f}s")
+                raise TimeoutError("Paratranz export not ready")
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, MAX_EXPORT_INTERVAL)
 
     def _trigger_export(self):
         url = f"{self.base_url}/projects/{self.project_id}/artifacts"
-        self.client.post(url, headers=self.headers)
+        response = self.client.post(url, headers=self.headers)
+        if response.is_error:
+            self.logger.warning(f"Triggering export got HTTP {response.status_code}, waiting for it anyway")
+
+    def _get_artifact(self) -> ParatranzArtifactModel | None:
+        """latest export, None if there is none yet"""
+        url = f"{self.base_url}/projects/{self.project_id}/artifacts"
+        response = self.client.get(url, headers=self.headers)
+        if response.status_code == httpx.codes.NOT_FOUND or not response.content:
+            return None
+        return ParatranzArtifactModel.model_validate(response.raise_for_status().json())
+
+    def _download_artifacts(self, record: dict) -> bool:
+        """
+        stream the artifact to disk, conditionally on what was downloaded last time
 
-    def _download_artifacts(self):
+        :param record: validators and digest of the last download, updated in place
+        :return: False if the artifact is the same as last time
+        """
         url = f"{self.base_url}/projects/{self.project_id}/artifacts/download"
+        headers = {**self.headers}
+        if record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+        if record.get("lastModified"):
+            headers["If-Modified-Since"] = record["lastModified"]
+
+        size, hasher = 0, hashlib.sha256()
+        tmp = ARTIFACT.with_name(f"{ARTIFACT.name}.tmp")
         try:
-            content = (self.client.get(url, headers=self.headers, follow_redirects=True)).content
+            with self.client.stream("GET", url, headers=headers, follow_redirects=True) as response:
+                if response.status_code == httpx.codes.NOT_MODIFIED:
+                    self.logger.info("Artifact not modified since last download")
+                    return False
+
+                total = int(response.headers.get("Content-Length", 0)) or None
+                with tmp.open("wb") as fp:
+                    reported = 0
+                    for chunk in response.iter_bytes(CHUNK_SIZE):
+                        fp.write(chunk)
+                        hasher.update(chunk)
+                        size += len(chunk)
+                        if size - reported >= PROGRESS_STEP:
+                            reported = size
+                            self.logger.info(f"Downloaded {self._progress(size, total)}")
+                etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
         except httpx.ConnectError as e:
             self.logger.error(f"Error downloading artifacts: {e}")
             raise
+        tmp.replace(ARTIFACT)
+
+        self.logger.info(f"Artifact size: {size}")
+        if size <= 52:
+            self.logger.bind(filepath=ARTIFACT.read_bytes()).warning("Artifact size too small")
+
+        changed = hasher.hexdigest() != record.get("digest")
+        record.update(etag=etag, lastModified=last_modified, digest=hasher.hexdigest())
+        if not changed:
+            self.logger.info("Artifact is the same as last download")
+        return changed
 
-        self.logger.info(f"Artifact size: {len(content)}")
-        if len(content) <= 52:
-            self.logger.bind(filepath=content).warning("Artifact size too small")
-        with open(settings.filepath.root / settings.filepath.tmp / "paratranz_export.zip", "wb") as fp:
-            fp.write(content)
+    @staticmethod
+    def _progress(size: int, total: int | None) -> str:
+        if total is None:
+            return f"{size / 1024 / 1024:.1f} MiB"
+        return f"{size / 1024 / 1024:.1f} / {total / 1024 / 1024:.1f} MiB ({size / total:.0%})"
 
     def _extract_artifacts(self):
         try:
-            with ZipFile(settings.filepath.root / settings.filepath.tmp / "paratranz_export.zip") as zfp:
-                zfp.extractall(settings.filepath.root / settings.filepath.tmp)
+            written = extract(ARTIFACT, DIR_DOWNLOAD)
+            self.logger.debug(f"Extracted {written} changed files")
         except BadZipFile as e:
             self.logger.error(f"Download artifact might failed due to some reason, try again: {e}")
             raise
@@ -83,12 +383,6 @@ class Paratranz:
             self.logger.error(f"Error opening artifacts: {e}")
             raise
 
-        shutil.copytree(
-            settings.filepath.root / settings.filepath.tmp / "utf8",
-            settings.filepath.root / settings.filepath.download,
-            dirs_exist_ok=True
-        )
-
     @property
     def client(self) -> httpx.Client:
         return self._client
@@ -105,6 +399,16 @@ class Paratranz:
     def project_id(self) -> int:
         return self._project_id
 
+    @property
+    def responses(self) -> Manifest:
+        """cached responses of GET endpoints, `path -> {time, data}`"""
+        return self._responses
+
+    @property
+    def export_wait(self) -> float | None:
+        """seconds spent waiting for the last export, None if not exported"""
+        return self._export_wait
+
     @property
     def logger(self) -> Logger:
         return self._logger
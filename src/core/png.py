@@ -0,0 +1,325 @@
+"""Lossless PNG optimization in pure Python."""
+import hashlib
+import os
+import struct
+import zlib
+from functools import cache
+from pathlib import Path
+from typing import NamedTuple
+
+from src.config import DIR_CACHE
+from src.log import logger
+
+SIGNATURE = b"\x89PNG\r\n\x1a\n"
+"""bump when the optimizer produces different output, invalidates the cache"""
+VERSION = 1
+"""optimized images by the sha256 of their original, empty files mean the original is kept"""
+DIR_PNG_CACHE = DIR_CACHE / "png"
+
+"""bytes per pixel of 8-bit images by color type"""
+_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+"""chunks bound to the color type, dropped when it changes"""
+_COLOR_CHUNKS = {b"PLTE", b"bKGD", b"sBIT", b"hIST", b"tRNS"}
+"""|x| of each byte read as a signed filtered value, for the minimum sum heuristic"""
+_ABS = bytes(min(i, 256 - i) for i in range(256))
+
+_logger = logger.bind(project_name="PNG")
+
+
+class Image(NamedTuple):
+    """8-bit non-interlaced pixels without filter bytes"""
+    width: int
+    height: int
+    color_type: int
+    pixels: bytes
+    palette: bytes = b""
+    transparency: bytes = b""
+
+    @property
+    def bpp(self) -> int:
+        return _CHANNELS[self.color_type]
+
+
+def read_chunks(data: bytes) -> list[tuple[bytes, bytes]]:
+    """`(type, data)` of every chunk, ValueError if `data` is not a PNG"""
+    if not data.startswith(SIGNATURE):
+        raise ValueError("not a PNG")
+    chunks, pos = [], len(SIGNATURE)
+    while pos < len(data):
+        length, type_ = struct.unpack(">I4s", data[pos:pos + 8])
+        chunks.append((type_, data[pos + 8:pos + 8 + length]))
+        pos += 12 + length
+        if type_ == b"IEND":
+            break
+    return chunks
+
+
+def write_chunks(chunks: list[tuple[bytes, bytes]]) -> bytes:
+    return SIGNATURE + b"".join(
+        struct.pack(">I4s", len(data), type_) + data + struct.pack(">I", zlib.crc32(type_ + data))
+        for type_, data in chunks
+    )
+
+
+@cache
+def _masks(length: int) -> tuple[int, int]:
+    """0x7f7f... and 0x8080... over `length` bytes"""
+    return int.from_bytes(b"\x7f" * length, "big"), int.from_bytes(b"\x80" * length, "big")
+
+
+def _add(a: bytes, b: bytes) -> bytes:
+    """bytewise (a + b) % 256 on whole rows at once"""
+    low, high = _masks(len(a))
+    x, y = int.from_bytes(a, "big"), int.from_bytes(b, "big")
+    return (((x & low) + (y & low)) ^ ((x ^ y) & high)).to_bytes(len(a), "big")
+
+
+def _sub(a: bytes, b: bytes) -> bytes:
+    """bytewise (a - b) % 256 on whole rows at once"""
+    low, high = _masks(len(a))
+    x, y = int.from_bytes(a, "big"), int.from_bytes(b, "big")
+    return (((x | high) - (y & low)) ^ ((x ^ y ^ high) & high)).to_bytes(len(a), "big")
+
+
+def _average(a: bytes, b: bytes) -> bytes:
+    """bytewise (a + b) // 2 on whole rows at once"""
+    low, _ = _masks(len(a))
+    x, y = int.from_bytes(a, "big"), int.from_bytes(b, "big")
+    return ((x & y) + (((x ^ y) >> 1) & low)).to_bytes(len(a), "big")
+
+
+def _paeth(line: bytes, prev: bytes, bpp: int) -> bytes:
+    """the Paeth predictor of each byte"""
+    predicted = bytearray(len(line))
+    for i in range(len(line)):
+        a = line[i - bpp] if i >= bpp else 0
+        b = prev[i]
+        c = prev[i - bpp] if i >= bpp else 0
+        pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2 * c)
+        predicted[i] = a if pa <= pb and pa <= pc else b if pb <= pc else c
+    return bytes(predicted)
+
+
+def unfilter(raw: bytes, width: int, height: int, bpp: int) -> bytes:
+    """pixels of decompressed IDAT data of an 8-bit non-interlaced image"""
+    stride = width * bpp
+    pixels, prev, pos = bytearray(), bytes(stride), 0
+    for _ in range(height):
+        filter_type, line = raw[pos], bytes(raw[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        if filter_type == 1:
+            restored = bytearray(line)
+            for i in range(bpp, stride):
+                restored[i] = (restored[i] + restored[i - bpp]) & 0xFF
+            line = bytes(restored)
+        elif filter_type == 2:
+            line = _add(line, prev)
+        elif filter_type == 3:
+            restored = bytearray(line)
+            for i in range(stride):
+                left = restored[i - bpp] if i >= bpp else 0
+                restored[i] = (restored[i] + ((left + prev[i]) >> 1)) & 0xFF
+            line = bytes(restored)
+        elif filter_type == 4:
+            restored = bytearray(line)
+            for i in range(stride):
+                a = restored[i - bpp] if i >= bpp else 0
+                b = prev[i]
+                c = prev[i - bpp] if i >= bpp else 0
+                pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2 * c)
+                restored[i] = (restored[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+            line = bytes(restored)
+        elif filter_type != 0:
+            raise ValueError(f"unknown filter type {filter_type}")
+        pixels += line
+        prev = line
+    return bytes(pixels)
+
+
+def filter_rows(image: Image) -> list[list[bytes]]:
+    """rows filtered by each of the five filter types, with the filter byte"""
+    stride = image.width * image.bpp
+    rows, prev = [], bytes(stride)
+    for y in range(image.height):
+        line = image.pixels[y * stride:(y + 1) * stride]
+        left = bytes(image.bpp) + line[:-image.bpp] if stride else line
+        rows.append([
+            b"\x00" + line,
+            b"\x01" + _sub(line, left),
+            b"\x02" + _sub(line, prev),
+            b"\x03" + _sub(line, _average(left, prev)),
+            b"\x04" + _sub(line, _paeth(line, prev, image.bpp)),
+        ])
+        prev = line
+    return rows
+
+
+def deflate(data: bytes) -> bytes:
+    """smallest zlib stream at level 9 among strategies"""
+    streams = []
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        streams.append(compressor.compress(data) + compressor.flush())
+    return min(streams, key=len)
+
+
+def encode(image: Image) -> list[bytes]:
+    """IDAT data of `image` with different filter selections"""
+    rows = filter_rows(image)
+    selections = [
+        b"".join(min(row, key=lambda filtered: sum(filtered[1:].translate(_ABS))) for row in rows),  # minimum sum
+        b"".join(row[0] for row in rows),
+    ]
+    if image.color_type != 3:  # predictors do not help indexes
+        selections.append(b"".join(row[4] for row in rows))
+    return [deflate(selection) for selection in selections]
+
+
+def variants(image: Image) -> list[Image]:
+    """the same pixels in other exact color types"""
+    images = [image]
+    if image.color_type == 6 and image.pixels[3::4].count(255) == image.width * image.height:  # opaque
+        rgb = bytearray(image.width * image.height * 3)
+        for channel in range(3):
+            rgb[channel::3] = image.pixels[channel::4]
+        images.append(Image(image.width, image.height, 2, bytes(rgb)))
+
+    for candidate in list(images):
+        if candidate.color_type in (2, 6) and not candidate.transparency and (indexed := palettize(candidate)):
+            images.append(indexed)
+    return images
+
+
+def palettize(image: Image) -> Image | None:
+    """indexed version of a truecolor image with at most 256 colors, None if it has more"""
+    bpp, pixels = image.bpp, image.pixels
+    colors = set()
+    for i in range(0, len(pixels), bpp):
+        colors.add(pixels[i:i + bpp])
+        if len(colors) > 256:
+            return None
+
+    # translucent colors first, so tRNS stops at the last of them
+    palette = sorted(colors, key=lambda color: (bpp == 3 or color[3] == 255, color))
+    index = {color: i for i, color in enumerate(palette)}
+    indexes = bytes(index[pixels[i:i + bpp]] for i in range(0, len(pixels), bpp))
+    transparency = bytes(color[3] for color in palette if bpp == 4 and color[3] != 255)
+    return Image(
+        image.width, image.height, 3, indexes,
+        palette=b"".join(color[:3] for color in palette),
+        transparency=transparency,
+    )
+
+
+def expand(image: Image) -> bytes:
+    """pixels of `image` as RGBA, to compare images of different color types"""
+    pixels, count = image.pixels, image.width * image.height
+    rgba = bytearray(count * 4)
+    if image.color_type == 6:
+        return pixels
+    if image.color_type == 2:
+        for channel in range(3):
+            rgba[channel::4] = pixels[channel::3]
+        rgba[3::4] = b"\xff" * count
+        return bytes(rgba)
+    if image.color_type == 3:
+        alphas = image.transparency + b"\xff" * (256 - len(image.transparency))
+        colors = [image.palette[i * 3:i * 3 + 3] + alphas[i:i + 1] for i in range(len(image.palette) // 3)]
+        return b"".join(colors[i] for i in pixels)
+    raise ValueError(f"color type {image.color_type} is not expanded")
+
+
+def optimize(data: bytes) -> bytes:
+    """
+    recompress a PNG losslessly, trying filter selections, deflate strategies and exact color type reductions
+
+    :return: the smallest result, or `data` itself if nothing beats it
+    """
+    chunks = read_chunks(data)
+    width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", chunks[0][1])
+    raw = zlib.decompress(b"".join(chunk for type_, chunk in chunks if type_ == b"IDAT"))
+    first_idat = next(i for i, (type_, _) in enumerate(chunks) if type_ == b"IDAT")
+    before_idat = chunks[1:first_idat]
+    after_idat = [(type_, chunk) for type_, chunk in chunks[first_idat:] if type_ not in (b"IDAT", b"IEND")]
+
+    # filters kept as they are, works for any bit depth and interlacing
+    candidates = [write_chunks([chunks[0], *before_idat, (b"IDAT", deflate(raw)), *after_idat, (b"IEND", b"")])]
+
+    source = None
+    if depth == 8 and interlace == 0 and color_type in _CHANNELS:
+        ancillary = dict(before_idat)
+        source = Image(
+            width, height, color_type, unfilter(raw, width, height, _CHANNELS[color_type]),
+            palette=ancillary.get(b"PLTE", b""), transparency=ancillary.get(b"tRNS", b""),
+        )
+        for image in variants(source):
+            ihdr = struct.pack(">IIBBBBB", width, height, 8, image.color_type, 0, 0, 0)
+            kept = before_idat
+            if image.color_type != color_type:
+                kept = [(type_, chunk) for type_, chunk in before_idat if type_ not in _COLOR_CHUNKS]
+                if image.palette:
+                    kept.append((b"PLTE", image.palette))
+                if image.transparency:
+                    kept.append((b"tRNS", image.transparency))
+            for idat in encode(image):
+                candidates.append(write_chunks([(b"IHDR", ihdr), *kept, (b"IDAT", idat), *after_idat, (b"IEND", b"")]))
+
+    best = min(candidates, key=len)
+    if len(best) >= len(data):
+        return data
+    if not _same(source, data, best):
+        _logger.error("Optimized image differs from the original, kept the original")
+        return data
+    return best
+
+
+def _same(source: Image | None, original: bytes, optimized: bytes) -> bool:
+    """decode `optimized` again and compare it with the original"""
+    chunks = read_chunks(optimized)
+    width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", chunks[0][1])
+    raw = zlib.decompress(b"".join(chunk for type_, chunk in chunks if type_ == b"IDAT"))
+    if source is None or (depth, interlace) != (8, 0):
+        original_chunks = read_chunks(original)
+        return raw == zlib.decompress(b"".join(chunk for type_, chunk in original_chunks if type_ == b"IDAT"))
+
+    ancillary = dict(chunks)
+    image = Image(
+        width, height, color_type, unfilter(raw, width, height, _CHANNELS[color_type]),
+        palette=ancillary.get(b"PLTE", b""), transparency=ancillary.get(b"tRNS", b""),
+    )
+    if color_type == source.color_type:
+        return image.pixels == source.pixels
+    return expand(image) == expand(source)
+
+
+def optimize_file(source: Path, destination: Path) -> tuple[int, int]:
+    """
+    write the optimized `source` to `destination`, through the cache, runs in worker processes
+
+    :return: sizes before and after
+    """
+    data = source.read_bytes()
+    cached = DIR_PNG_CACHE / f"{VERSION}-{hashlib.sha256(data).hexdigest()}.png"
+    if cached.exists():
+        optimized = cached.read_bytes() or data
+    else:
+        try:
+            optimized = optimize(data)
+        except Exception as e:  # a broken image is shipped as it is, it never stops the restore
+            _logger.bind(filepath=source).warning(f"Not optimized: {e!r}")
+            optimized = data
+        DIR_PNG_CACHE.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")  # identical images may be in several workers
+        tmp.write_bytes(optimized if optimized is not data else b"")
+        tmp.replace(cached)
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.unlink(missing_ok=True)  # may be linked to `source`
+    destination.write_bytes(optimized)
+    return len(data), len(optimized)
+
+
+__all__ = [
+    "optimize",
+    "optimize_file",
+]
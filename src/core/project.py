@@ -1,22 +1,30 @@
 import io
-import json
+import os
 import shutil
 from contextlib import suppress
 from pathlib import Path
-from zipfile import ZIP_DEFLATED
-from zipfile import ZipFile as zf
 
 from loguru._logger import Logger
 
-from src.config import DIR_RESULT, settings
+from src.codec import json_load
+from src.config import DIR_CONVERT, DIR_DOWNLOAD, DIR_RESULT, settings
+from src.core import delta
+from src.core.archive import pack, scan
+from src.core.cache import parsed_cache, snapshot
 from src.core.paratranz import Paratranz
 from src.log import logger
 from src.schema.enum import FileType
 from src.schema.model import ParatranzProjectModel
 
 
+"""in names of delta archives, which are never reused as the previous archive"""
+DELTA_MARK = " (delta from "
+
+
 class Project:
 	logger = logger.bind(project_name="Project")
+	"""kept between runs in workspace mode, stages reuse what is unchanged"""
+	workspace_filepaths = (DIR_CONVERT, DIR_DOWNLOAD, DIR_RESULT)
 
 	def check_structure(self):
 		"""check if necessary files exist"""
@@ -25,6 +33,11 @@ class Project:
 
 	def clean(self, *filepaths: Path):
 		for filepath in filepaths:
+			if settings.project.workspace and filepath in self.workspace_filepaths:
+				filepath.mkdir(exist_ok=True, parents=True)
+				Project.logger.bind(filepath=filepath).success("Filepath preserved in workspace mode")
+				continue
+
 			with suppress(FileNotFoundError):
 				shutil.rmtree(filepath)
 			filepath.mkdir(exist_ok=True, parents=True)
@@ -64,6 +77,49 @@ class Project:
 		Project.logger.bind(filepath=filepath).error("Unknown filetype when categorize")
 		return None
 
+	@staticmethod
+	def index_by_id(records: list, filepath: Path | None = None) -> dict[int, int]:
+		"""
+		map ids of an RPG Maker database array to indexes,
+		which are the same as the array keeps record `n` at index `n` (index 0 is null)
+
+		:param records: loaded array, nulls included
+		:param filepath: for logging only
+		:return: id -> index, the first one wins if an id repeats
+		"""
+		index: dict[int, int] = {}
+		misplaced = 0
+		for idx, record in enumerate(records):
+			if record is None:
+				continue
+			if record.id in index:
+				Project.logger.bind(filepath=filepath).warning(
+					f"Duplicate id {record.id} at index {idx}, using index {index[record.id]}"
+				)
+				continue
+			index[record.id] = idx
+			misplaced += record.id != idx
+
+		if misplaced:
+			Project.logger.bind(filepath=filepath).warning(f"{misplaced} records are not at the index of their id")
+		return index
+
+	@staticmethod
+	def load(filepath: Path, type_: FileType, *, take: bool = False) -> list[str] | str | list | dict:
+		"""
+		read a game file through the parsed cache shared by stages, then the snapshot kept between runs
+
+		:param filepath: game file
+		:param type_: file type
+		:param take: hand the cached content over instead of sharing it, for callers modifying it
+		:return: same as `read`
+		"""
+		def _read(filepath_: Path):
+			with filepath_.open("r", encoding="utf-8") as fp:
+				return Project.read(fp, type_)
+
+		return parsed_cache.get(filepath, lambda filepath_: snapshot.get(filepath_, _read), take=take)
+
 	@staticmethod
 	def read(fp: io.TextIOWrapper, type_: FileType) -> list[str] | str | list | dict:
 		match type_:
@@ -72,7 +128,7 @@ class Project:
 				return fp.read()
 			case FileType.MAP | FileType.SYSTEM | FileType.MAPINFOS | FileType.ITEMS | FileType.SKILLS | FileType.COMMON_EVENTS:  # noqa: E501
 				Project.logger.debug(f"Reading {type_}")
-				return json.load(fp)
+				return json_load(fp)
 			case _:
 				Project.logger.error(f"Reading unknown type failed: {type_}")
 				raise TypeError
@@ -91,17 +147,41 @@ class Project:
 			f"-{model.stats.cp*10000:.0f}"
 			f".zip"
 		)
-		with zf(settings.filepath.root / settings.filepath.dist / filename, "w", compresslevel=9, compression=ZIP_DEFLATED) as zfp:  # noqa: E501
-			for filepath in DIR_RESULT.glob("**/*"):
-				if filepath.is_dir():
-					continue
-				zfp.write(
-					filename=filepath,
-					arcname=filepath.relative_to(DIR_RESULT),
-					compresslevel=9
-				)
+		dist = settings.filepath.root / settings.filepath.dist
+		previous = None
+		if settings.package.incremental:
+			previous = max(
+				(filepath for filepath in dist.glob("*.zip") if DELTA_MARK not in filepath.name),
+				key=lambda filepath: filepath.stat().st_mtime,
+				default=None,
+			)
+
+		# the previous archive may have the same name, it is read until the new one is complete
+		files = scan(DIR_RESULT)
+		tmp = dist / f"{filename}.tmp"
+		with tmp.open("wb") as fp:
+			counter = pack(
+				fp, files,
+				jobs=settings.package.jobs or os.cpu_count() or 1,
+				previous=previous,
+				reproducible=settings.package.reproducible,
+			)
+		tmp.replace(dist / filename)
+		if previous is not None:
+			Project.logger.bind(filepath=previous.name).debug(
+				f"{counter[True]} entries reused, {counter[False]} compressed"
+			)
 		Project.logger.bind(filepath=settings.filepath.dist / filename).success("Successfully package Chinese patch.")
 
+		if settings.package.delta_from:
+			base = Path(settings.package.delta_from)
+			delta_filename = f"{Path(filename).stem}{DELTA_MARK}{base.stem}).zip"
+			with (dist / delta_filename).open("wb") as fp:
+				delta.build(fp, files, base)
+			Project.logger.bind(filepath=settings.filepath.dist / delta_filename).success(
+				"Successfully package delta patch."
+			)
+
 
 
 __all__ = [
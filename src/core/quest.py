@@ -0,0 +1,92 @@
+"""Tokenize quest files of Galv_QuestLog.js"""
+import re
+from typing import Iterator, NamedTuple, TextIO
+
+OPEN = "<quest "
+CLOSE = "</quest>"
+_ID = re.compile(r"\d+:")
+_DIGITS = re.compile(r"\d*")
+_HEADER_END = re.compile(r"\|\d+\|\d+>")  # `|<category>|<difficulty>>`
+
+"""characters read from a stream at least each time"""
+CHUNK_SIZE = 1 << 16
+
+
+class Quest(NamedTuple):
+    """`<quest id:title|category|difficulty>...</quest>`"""
+    id: str
+    raw: str
+    span: tuple[int, int]
+
+
+def _match(text: str, pos: int) -> tuple[int, int, str] | None:
+    """
+    find the next complete quest without backtracking
+
+    :param text: (part of) quest file
+    :param pos: where to start searching
+    :return: start, end and id of the quest, None if there is no complete quest in `text`
+    """
+    while (start := text.find(OPEN, pos)) != -1:
+        id_start = start + len(OPEN)
+        id_ = _ID.match(text, id_start)
+        if id_ is None:
+            if _DIGITS.fullmatch(text, id_start):  # id cut off
+                return None
+            pos = start + 1
+            continue
+
+        header_end = _HEADER_END.search(text, id_.end() + 1)
+        if header_end is None:
+            return None
+
+        close = text.find(CLOSE, header_end.end() + 1)
+        if close == -1:
+            return None
+
+        return start, close + len(CLOSE), id_.group()[:-1]
+    return None
+
+
+def tokenize_quests(source: str | TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Quest]:
+    """
+    split a quest file into quests in one pass,
+    same as `re.findall(r"<quest (\\d+?):[\\s\\S]+?\\|\\d+?\\|\\d+?>[\\s\\S]+?</quest>", ...)` but linear
+
+    :param source: whole text of a quest file, or the opened file to read it chunk by chunk
+    :param chunk_size: characters to read each time when `source` is a stream
+    :return: quests in order, spans are offsets in the whole text
+    """
+    if isinstance(source, str):
+        pos = 0
+        while (matched := _match(source, pos)) is not None:
+            start, end, id_ = matched
+            yield Quest(id_, source[start:end], (start, end))
+            pos = end
+        return
+
+    buffer, offset, eof = "", 0, False
+    while True:
+        matched = _match(buffer, 0)
+        if matched is None:
+            if eof:
+                return
+            if buffer.find(OPEN) == -1:  # nothing to keep but a possible cut-off `<quest `
+                keep = len(OPEN) - 1
+                offset += max(len(buffer) - keep, 0)
+                buffer = buffer[-keep:]
+            chunk = source.read(max(chunk_size, len(buffer)))
+            eof = not chunk
+            buffer += chunk
+            continue
+
+        start, end, id_ = matched
+        yield Quest(id_, buffer[start:end], (offset + start, offset + end))
+        buffer = buffer[end:]
+        offset += end
+
+
+__all__ = [
+    "Quest",
+    "tokenize_quests",
+]
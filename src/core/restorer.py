@@ -1,88 +1,280 @@
-import json
-import re
-import shutil
+import hashlib
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterable
 
 from pydantic import BaseModel
 
-from src.config import DIR_DOWNLOAD, DIR_RESULT, DIR_SPECIAL, GAME_ROOT
+from src.codec import json_dump, json_load
+from src.config import DIR_DOWNLOAD, DIR_RESULT, DIR_SPECIAL, GAME_ROOT, settings
+from src.core.cache import Manifest, digest, in_worker, snapshot
+from src.core.download import DownloadView
+from src.core.mirror import mirror
+from src.core.png import VERSION as PNG_VERSION, optimize_file
 from src.core.project import Project
+from src.core.quest import tokenize_quests
+from src.core.segmenter import segment, text
 from src.log import logger
-from src.schema.enum import Code, FileType
-from src.schema.model import (GameCommonEventModel, GameItemModel, GameMapInfoModel, GameMapModel, GameSkillModel,
-                              GameSystemModel, ParatranzModel)
+from src.schema.enum import Code, Executor, FileType, ProcessStatus
+from src.schema.model import (GameCommonEventModel, GameCommonEventUnitModel, GameItemModel, GameMapInfoModel,
+                              GameMapModel, GameMapUnitModel, GameSkillModel, GameSystemModel, ParatranzModel)
 
 
 class Restorer:
     """restore local files from paratranz result"""
     logger = logger.bind(project_name="Restore")
-
-    def restore(self):
+    """bump when restored files change for the same input, invalidates the manifest"""
+    version = 1
+
+    def __init__(
+        self,
+        jobs: int = settings.restore.jobs,
+        executor: Executor = settings.restore.executor,
+        incremental: bool = settings.project.workspace,
+        strict: bool = settings.project.strict,
+        pretty: bool = settings.restore.pretty,
+        download: DownloadView | None = None,
+        optimize_png: bool = settings.restore.optimize_png,
+    ):
+        self._jobs = jobs or os.cpu_count() or 1
+        self._executor = executor
+        self._incremental = incremental
+        self._strict = strict
+        self._pretty = pretty
+        self._download = download or DownloadView()
+        self._optimize_png = optimize_png
+
+    def restore(self) -> Counter[ProcessStatus]:
         self.logger.info("")
         self.logger.info("======= RESTORE START =======")
-        DIR_DOWNLOAD.mkdir(exist_ok=True, parents=True)
-        for filepath in DIR_DOWNLOAD.glob("**/*"):
-            if filepath.is_dir():
-                continue
-
-            relative_filepath = filepath.relative_to(DIR_DOWNLOAD)
-            if relative_filepath.parts[0] != 'www':
-                continue
+        filepaths = self.download.glob()
+
+        manifest, fingerprints = None, {}
+        if self.incremental:
+            manifest = Manifest("restore")
+            fingerprints = {filepath: self._fingerprint(filepath) for filepath in filepaths}
+            self._prune(manifest, filepaths)
+            filepaths = [
+                filepath
+                for filepath in filepaths
+                if not self._unchanged(manifest, filepath, fingerprints[filepath])
+            ]
+            self.logger.debug(f"{len(filepaths)} of {len(fingerprints)} files changed since last run")
+
+        # special files do not depend on the downloaded ones
+        with ThreadPoolExecutor(max_workers=1) as special_executor:
+            special = special_executor.submit(self.restore_special)
+            if self.jobs > 1:
+                self.logger.debug(f"Restoring with {self.jobs} {self.executor.value}s")
+                executor_class = ProcessPoolExecutor if self.executor == Executor.PROCESS else ThreadPoolExecutor
+                with executor_class(max_workers=self.jobs) as executor:
+                    results = list(executor.map(in_worker, repeat(self._restore_file), filepaths))
+                statuses = [status for status, _ in results]
+                for _, updates in results:
+                    snapshot.merge(updates)
+            else:
+                statuses = [self._restore_file(filepath) for filepath in filepaths]
+            special.result()
+        snapshot.save()
+        if self.optimize_png:  # after the pools are gone, workers are not forked from a threaded process
+            self._optimize_special_png()
+
+        if manifest is not None:
+            for filepath, status in zip(filepaths, statuses):
+                key = filepath.relative_to(DIR_DOWNLOAD).as_posix()
+                if status == ProcessStatus.SUCCESS:
+                    manifest.set(key, fingerprints[filepath])
+                else:
+                    manifest.pop(key)
+            manifest.save()
+
+        counter = Counter(status for status in statuses if status is not None)
+        counter[ProcessStatus.SKIPPED] = len(fingerprints) - len(filepaths) if manifest is not None else 0
+        self.logger.info(
+            f"Restored {counter[ProcessStatus.SUCCESS]} files, "
+            f"{counter[ProcessStatus.FAILED]} failed, "
+            f"{counter[ProcessStatus.SKIPPED]} unchanged"
+        )
+        return counter
 
-            result_filepath = DIR_RESULT / relative_filepath.with_suffix("")
-            file_type = Project.categorize(result_filepath)
-            if not file_type:
-                continue
+    def _fingerprint(self, filepath: Path) -> dict:
+        """
+        everything a restored file depends on, downloaded entries are digested one by one
 
-            self.logger.bind(filepath=relative_filepath).debug("Restoring file")
-            match file_type:
-                # JSON
-                case FileType.MAP:
-                    model = self._restore_map(filepath, file_type)
-                case FileType.SYSTEM:
-                    model = self._restore_system(filepath, file_type)
-                case FileType.ITEMS:
-                    model = self._restore_items(filepath, file_type)
-                case FileType.SKILLS:
-                    model = self._restore_skills(filepath, file_type)
-                case FileType.COMMON_EVENTS:
-                    model = self._restore_common_events(filepath, file_type)
-                case FileType.MAPINFOS:
-                    model = self._restore_map_infos(filepath, file_type)
-                # TXT
-                case FileType.QUEST:
-                    model = self._restore_quest(filepath, file_type)
-                case _:
-                    self.logger.bind(filepath=relative_filepath).error("Unknown file type when restore")
-                    continue
+        :param filepath: downloaded filepath
+        :return: manifest record
+        """
+        relative_filepath = filepath.relative_to(DIR_DOWNLOAD)
+        with self.download.open(filepath) as fp:
+            download = json_load(fp)
 
-            if model is None:
-                self.logger.bind(filepath=relative_filepath).warning("Restoring file failed")
+        # only translated entries end up in the result, stage and context do not matter
+        entries = {}
+        for model in (ParatranzModel.model_validate(_) for _ in download):
+            if model.untranslated():
                 continue
+            entries[model.key] = hashlib.blake2b(
+                f"{model.original}\0{model.translation}".encode("utf-8"),
+                digest_size=8
+            ).hexdigest()
+
+        return {
+            "original": digest(GAME_ROOT / relative_filepath.with_suffix("")),
+            "version": f"{self.version}/{self.pretty}",
+            "entries": entries,
+        }
+
+    def _unchanged(self, manifest: Manifest, filepath: Path, fingerprint: dict) -> bool:
+        """game file and translated entries are the same as last run and its result is still there"""
+        relative_filepath = filepath.relative_to(DIR_DOWNLOAD)
+        record = manifest.get(relative_filepath.as_posix())
+        if record is None or not (DIR_RESULT / relative_filepath.with_suffix("")).exists():
+            return False
+
+        if record["original"] != fingerprint["original"] or record["version"] != fingerprint["version"]:
+            return False
+
+        previous, current = record["entries"], fingerprint["entries"]
+        changed = {key for key in previous.keys() | current.keys() if previous.get(key) != current.get(key)}
+        if changed:
+            self.logger.bind(filepath=relative_filepath).debug(f"{len(changed)} entries changed")
+        return not changed
+
+    def _prune(self, manifest: Manifest, filepaths: list[Path]):
+        """drop results of downloaded files which no longer exist"""
+        keys = {filepath.relative_to(DIR_DOWNLOAD).as_posix() for filepath in filepaths}
+        for key in [key for key in manifest.records if key not in keys]:
+            manifest.pop(key)
+            (DIR_RESULT / key).with_suffix("").unlink(missing_ok=True)
+            self.logger.bind(filepath=key).debug("Removed result of deleted downloaded file")
+
+    def _restore_file(self, filepath: Path) -> ProcessStatus | None:
+        """
+        restore one downloaded file and write it to DIR_RESULT, runs in workers when `jobs` > 1
+
+        :param filepath: downloaded filepath
+        :return: None if the file is not to be restored
+        """
+        relative_filepath = filepath.relative_to(DIR_DOWNLOAD)
+        if relative_filepath.parts[0] != 'www':
+            return None
+
+        result_filepath = DIR_RESULT / relative_filepath.with_suffix("")
+        file_type = Project.categorize(result_filepath)
+        if not file_type:
+            return None
+
+        self.logger.bind(filepath=relative_filepath).debug("Restoring file")
+        match file_type:
+            # JSON
+            case FileType.MAP:
+                model = self._restore_map(filepath, file_type)
+            case FileType.SYSTEM:
+                model = self._restore_system(filepath, file_type)
+            case FileType.ITEMS:
+                model = self._restore_items(filepath, file_type)
+            case FileType.SKILLS:
+                model = self._restore_skills(filepath, file_type)
+            case FileType.COMMON_EVENTS:
+                model = self._restore_common_events(filepath, file_type)
+            case FileType.MAPINFOS:
+                model = self._restore_map_infos(filepath, file_type)
+            # TXT
+            case FileType.QUEST:
+                model = self._restore_quest(filepath, file_type)
+            case _:
+                self.logger.bind(filepath=relative_filepath).error("Unknown file type when restore")
+                return ProcessStatus.FAILED
+
+        if model is None:
+            self.logger.bind(filepath=relative_filepath).warning("Restoring file failed")
+            return ProcessStatus.FAILED
+
+        (DIR_RESULT / relative_filepath).parent.mkdir(exist_ok=True, parents=True)
+        if isinstance(model, str):
+            with (DIR_RESULT / result_filepath).open("w", encoding="utf-8") as fp:
+                fp.write(model)
+            self.logger.bind(filepath=relative_filepath).debug("Restoring file successfully.")
+            return ProcessStatus.SUCCESS
 
-            (DIR_RESULT / relative_filepath).parent.mkdir(exist_ok=True, parents=True)
-            if isinstance(model, str):
-                with (DIR_RESULT / result_filepath).open("w", encoding="utf-8") as fp:
-                    fp.write(model)
-                self.logger.bind(filepath=relative_filepath).debug("Restoring file successfully.")
-                continue
+        elif isinstance(model, list):
+            datas = [m.model_dump() if m is not None else None for m in model]
 
-            elif isinstance(model, list):
-                datas = [m.model_dump() if m is not None else None for m in model]
+        else:
+            datas = model.model_dump()
 
-            else:
-                datas = model.model_dump()
+        with (DIR_RESULT / result_filepath).open("wb") as fp:
+            json_dump(datas, fp, pretty=self.pretty)
+        self.logger.bind(filepath=relative_filepath).debug("Restoring file successfully.")
+        return ProcessStatus.SUCCESS
 
-            with (DIR_RESULT / result_filepath).open("w", encoding="utf-8") as fp:
-                json.dump(datas, fp, ensure_ascii=False)
-            self.logger.bind(filepath=relative_filepath).debug("Restoring file successfully.")
+    def restore_special(self):
+        """place special files into the result, PNGs are left to `_optimize_special_png` when optimizing"""
+        counter = mirror(DIR_SPECIAL, DIR_RESULT, ignore=self._ignore_png if self.optimize_png else None)
+        self.logger.debug(
+            f"Restoring special files successfully, "
+            f"{counter.total() - counter[None]} placed, {counter[None]} already in place."
+        )
 
-        self.restore_special()
+    @staticmethod
+    def _ignore_png(_: str, names: list[str]) -> set[str]:
+        return {name for name in names if name.lower().endswith(".png")}
+
+    def _optimize_special_png(self):
+        """
+        write special PNGs recompressed losslessly into the result, in `jobs` processes,
+        skipping those whose result is still the one optimized from the same source
+        """
+        manifest = Manifest("png")
+        sources = [filepath for filepath in DIR_SPECIAL.glob("**/*") if filepath.suffix.lower() == ".png"]
+        keys = {filepath: filepath.relative_to(DIR_SPECIAL).as_posix() for filepath in sources}
+        for key in [key for key in manifest.records if key not in keys.values()]:
+            manifest.pop(key)
+
+        digests = {filepath: digest(filepath) for filepath in sources}
+        sources = [
+            filepath
+            for filepath in sources
+            if not self._png_optimized(manifest, keys[filepath], digests[filepath])
+        ]
+        destinations = [DIR_RESULT / keys[filepath] for filepath in sources]
+        if self.jobs > 1 and len(sources) > 1:
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                sizes = list(executor.map(optimize_file, sources, destinations))
+        else:
+            sizes = [optimize_file(source, destination) for source, destination in zip(sources, destinations)]
+
+        for source, destination in zip(sources, destinations):
+            stat = destination.stat()
+            manifest.set(keys[source], {
+                "source": digests[source],
+                "version": PNG_VERSION,
+                "result": [stat.st_size, stat.st_mtime_ns],
+            })
+        manifest.save()
+
+        before, after = sum(_[0] for _ in sizes), sum(_[1] for _ in sizes)
+        self.logger.info(
+            f"Optimized {len(sizes)} PNGs, {before - after} of {before} bytes saved, "
+            f"{len(keys) - len(sizes)} unchanged"
+        )
 
-    def restore_special(self):
-        shutil.copytree(DIR_SPECIAL, DIR_RESULT, dirs_exist_ok=True)
-        self.logger.debug("Restoring special files successfully.")
+    @staticmethod
+    def _png_optimized(manifest: Manifest, key: str, source_digest: str) -> bool:
+        """the result was optimized from the same source by the same optimizer and is untouched since"""
+        record = manifest.get(key)
+        try:
+            stat = (DIR_RESULT / key).stat()
+        except FileNotFoundError:
+            return False
+        return record == {
+            "source": source_digest,
+            "version": PNG_VERSION,
+            "result": [stat.st_size, stat.st_mtime_ns],
+        }
 
     def _restore_general(
         self, filepath: Path, type_: FileType,
@@ -90,12 +282,11 @@ class Restorer:
         **kwargs
     ) -> list[BaseModel] | BaseModel | str:
         relative_filepath = filepath.relative_to(DIR_DOWNLOAD)
-        with filepath.open("r", encoding="utf-8") as fp:
-            download = json.load(fp)
+        with self.download.open(filepath) as fp:
+            download = json_load(fp)
 
         filepath_original = GAME_ROOT / relative_filepath.with_suffix("")
-        with filepath_original.open("r", encoding="utf-8") as fp:
-            original = Project.read(fp, type_)
+        original = Project.load(filepath_original, type_, take=True)  # modified in place
 
         return process_function(
             filepath=filepath,
@@ -109,20 +300,21 @@ class Restorer:
             original: str = kwargs["original"]
             downloads: list[ParatranzModel] = [ParatranzModel.model_validate(_) for _ in kwargs["download"]]
 
-            pattern = re.compile(r"(<quest (\d+?):[\s\S]+?\|\d+?\|\d+?>[\s\S]+?</quest>)")
-            quests = re.findall(pattern, original)  # [(quest, idx)]
-            quests_map = {
-                idx: quest
-                for quest, idx in quests
+            translations = {
+                model.key: model.translation
+                for model in downloads
+                if not model.untranslated()
             }
 
-            for model in downloads:
-                if model.untranslated():
-                    continue
-
-                quests_map[model.key] = model.translation
-
-            return "\n\n".join(quests_map.values())
+            # splice translations in place, whatever lies between quests is kept as is
+            pieces, last = [], 0
+            for quest in tokenize_quests(original):
+                start, end = quest.span
+                pieces.append(original[last:start])
+                pieces.append(translations.get(quest.id, quest.raw))
+                last = end
+            pieces.append(original[last:])
+            return "".join(pieces)
 
         return self._restore_general(
             filepath=filepath,
@@ -132,9 +324,19 @@ class Restorer:
 
     def _restore_map(self, filepath: Path, type_: FileType) -> BaseModel:
         def _process(**kwargs):
-            original: GameMapModel = GameMapModel.model_validate(kwargs["original"])
+            original: GameMapModel = GameMapModel.load(kwargs["original"], strict=self.strict)
             downloads: list[ParatranzModel] = [ParatranzModel.model_validate(_) for _ in kwargs["download"]]
 
+            events = {event.id: event for event in original.events if event is not None}
+            units: dict[tuple[int, int, int], GameMapUnitModel] = {
+                (event.id, idx_page, idx_unit): unit
+                for event in events.values()
+                for idx_page, page in enumerate(event.pages)
+                for block in segment(page.list)
+                for idx_unit, unit in zip(block.indices, block.units)
+            }
+
+            missed, claimed = [], set()
             for model in downloads:
                 if model.untranslated():
                     continue
@@ -145,28 +347,24 @@ class Restorer:
 
                 event_id, event_name, idx_page, idx_unit, unit_code = (_.strip() for _ in model.key.split("|"))
                 event_id, idx_page, idx_unit, unit_code = int(event_id), int(idx_page), int(idx_unit), int(unit_code)
-                event_name = event_name.strip()
-
-                for idx_event, event in enumerate(original.events):
-                    if event is None:
-                        continue
-                    if any((event_id != event.id, event_name != event.name)):
-                        continue
-
-                    for idx_page_, page in enumerate(event.pages):
-                        for idx_unit_, unit in enumerate(page.list):
-                            if Code.DIALOG == unit.code == unit_code:
-                                if model.original != unit.parameters[0]:
-                                    continue
-                                original.events[idx_event].pages[idx_page_].list[idx_unit_].parameters[0] = model.translation  # noqa: E501
-                            elif Code.CHOICE == unit.code == unit_code:
-                                if model.original != "\n".join(unit.parameters[0]):
-                                    continue
-                                result_ = [
-                                    _ or model.original.split("\n")[idx]
-                                    for idx, _ in enumerate(model.translation.split("\n"))
-                                ]
-                                original.events[idx_event].pages[idx_page_].list[idx_unit_].parameters[0] = result_  # noqa: E501
+
+                event = events.get(event_id)
+                if event is None or event.name != event_name:
+                    continue
+
+                position = (event_id, idx_page, idx_unit)
+                unit = units.get(position)
+                if unit is not None and position not in claimed and self._restore_unit(unit, unit_code, model):
+                    claimed.add(position)
+                else:
+                    missed.append((event_id, unit_code, model))
+
+            # units moved since the text was uploaded, after every addressed unit is translated
+            for event_id, unit_code, model in missed:
+                self._restore_moved(
+                    ((position, unit) for position, unit in units.items() if position[0] == event_id),
+                    unit_code, model, claimed
+                )
 
             return original
 
@@ -176,47 +374,114 @@ class Restorer:
             process_function=_process,
         )
 
+    @staticmethod
+    def _restore_unit(unit: GameMapUnitModel | GameCommonEventUnitModel, unit_code: int, model: ParatranzModel) -> bool:
+        """
+        write the translation into a dialog / choice unit
+
+        :param unit: map or common event unit
+        :param unit_code: code recorded in the key
+        :param model: downloaded entry
+        :return: False if the unit is not the one translated
+        """
+        if unit.code != unit_code or model.original != text(unit):
+            return False
+
+        if Code.DIALOG == unit_code:
+            unit.parameters[0] = model.translation
+        elif Code.CHOICE == unit_code:
+            unit.parameters[0] = [
+                _ or model.original.split("\n")[idx]
+                for idx, _ in enumerate(model.translation.split("\n"))
+            ]
+        else:
+            return False
+        return True
+
+    @classmethod
+    def _restore_moved(
+        cls, units: Iterable[tuple[tuple[int, ...], GameMapUnitModel | GameCommonEventUnitModel]],
+        unit_code: int, model: ParatranzModel, claimed: set[tuple[int, ...]],
+    ) -> bool:
+        """
+        write the translation into the first unit not translated yet which holds its original text,
+        so entries of a repeated line each find their own unit
+
+        :param units: `(position, unit)` in order, positions as in the keys of the event
+        :param claimed: positions of units already translated, updated
+        :return: False if no unit matches
+        """
+        for position, unit in units:
+            if position not in claimed and cls._restore_unit(unit, unit_code, model):
+                claimed.add(position)
+                return True
+        return False
+
     def _restore_system(self, filepath: Path, type_: FileType) -> BaseModel:
         def _process(**kwargs):
-            original: GameSystemModel = GameSystemModel.model_validate(kwargs["original"])
+            original: GameSystemModel = GameSystemModel.load(kwargs["original"], strict=self.strict)
             downloads: list[ParatranzModel] = [ParatranzModel.model_validate(_) for _ in kwargs["download"]]
 
+            sections: dict[str, list[str | None] | dict[str, str]] = {
+                "skillTypes": original.skillTypes,
+                "basic": original.terms.basic,
+                "commands": original.terms.commands,
+                "params": original.terms.params,
+                "messages": original.terms.messages,
+            }
+            # the untouched sections, entries are matched against them and never against translations written before
+            untouched = {
+                section: dict(values) if isinstance(values, dict) else list(values)
+                for section, values in sections.items()
+            }
+            reverse: dict[str, dict[str, list[int | str]]] = {}  # section -> original text -> slots, built on demand
+
+            missed, claimed = [], set()
             for model in downloads:
                 if model.untranslated():
                     continue
 
                 if model.key == "gameTitle":
                     original.gameTitle = model.translation
-                elif model.key == "locale":
+                    continue
+                if model.key == "locale":
                     original.locale = model.translation
-                elif model.key.startswith("skillTypes"):
-                    for idx, skill_type in enumerate(original.skillTypes):
-                        if skill_type != model.original:
-                            continue
-                        original.skillTypes[idx] = model.translation
-                elif model.key.startswith("terms"):
-                    if "basic" in model.key:
-                        for idx, basic in enumerate(original.terms.basic):
-                            if basic != model.original:
-                                continue
-                            original.terms.basic[idx] = model.translation
-                    elif "commands" in model.key:
-                        for idx, command in enumerate(original.terms.commands):
-                            if command != model.original:
-                                continue
-                            original.terms.commands[idx] = model.translation
-                    elif "params" in model.key:
-                        for idx, param in enumerate(original.terms.params):
-                            if param != model.original:
-                                continue
-                            original.terms.params[idx] = model.translation
-                    elif "messages" in model.key:
-                        for key, value in original.terms.messages.items():
-                            if value != model.original:
-                                continue
-                            original.terms.messages[key] = model.translation
-                    else:
-                        raise
+                    continue
+
+                # `skillTypes | 3`, `terms | basic | 3`, `terms | messages | ... | actionFailure`
+                path = [_.strip() for _ in model.key.split("|")]
+                if path[0] == "skillTypes":
+                    section, slot = path[0], int(path[1])
+                elif path[0] == "terms" and path[1] == "messages":
+                    section, slot = path[1], path[-1]
+                elif path[0] == "terms" and path[1] in sections:
+                    section, slot = path[1], int(path[2])
+                else:
+                    raise
+
+                source = untouched[section]
+                if isinstance(source, dict):
+                    matched = source.get(slot) == model.original
+                else:
+                    matched = 0 <= slot < len(source) and source[slot] == model.original
+                if matched and (section, slot) not in claimed:
+                    sections[section][slot] = model.translation
+                    claimed.add((section, slot))
+                else:
+                    missed.append((section, model))
+
+            # slots moved since the text was uploaded, after every addressed slot is translated
+            for section, model in missed:
+                if section not in reverse:
+                    reverse[section] = {}
+                    source = untouched[section]
+                    for slot_, value in source.items() if isinstance(source, dict) else enumerate(source):
+                        reverse[section].setdefault(value, []).append(slot_)
+                for slot_ in reverse[section].get(model.original, ()):
+                    if (section, slot_) not in claimed:
+                        sections[section][slot_] = model.translation
+                        claimed.add((section, slot_))
+                        break
             return original
 
         return self._restore_general(
@@ -228,31 +493,28 @@ class Restorer:
     def _restore_items(self, filepath: Path, type_: FileType) -> list[BaseModel]:
         def _process(**kwargs):
             original: list[GameItemModel] = [
-                GameItemModel.model_validate(_) if _ is not None else _
+                GameItemModel.load(_, strict=self.strict) if _ is not None else _
                 for _ in kwargs["original"]
             ]
             downloads: list[ParatranzModel] = [ParatranzModel.model_validate(_) for _ in kwargs["download"]]
 
+            index = Project.index_by_id(original, kwargs["filepath"])
+
             for model in downloads:
                 if model.untranslated():
                     continue
 
                 item_id, item_type = model.key.split("|")
-                item_id = int(item_id)
-
-                for idx, item in enumerate(original):
-                    if item is None:
-                        continue
-
-                    if item.id != item_id:
-                        continue
+                idx = index.get(int(item_id))
+                if idx is None:
+                    continue
 
-                    if "name" in item_type:
-                        original[idx].name = model.translation
-                    elif "description" in item_type:
-                        original[idx].description = model.translation
-                    else:
-                        raise
+                if "name" in item_type:
+                    original[idx].name = model.translation
+                elif "description" in item_type:
+                    original[idx].description = model.translation
+                else:
+                    raise
 
             return original
 
@@ -265,31 +527,28 @@ class Restorer:
     def _restore_skills(self, filepath: Path, type_: FileType) -> list[BaseModel]:
         def _process(**kwargs):
             original: list[GameSkillModel] = [
-                GameSkillModel.model_validate(_) if _ is not None else _
+                GameSkillModel.load(_, strict=self.strict) if _ is not None else _
                 for _ in kwargs["original"]
             ]
             downloads: list[ParatranzModel] = [ParatranzModel.model_validate(_) for _ in kwargs["download"]]
 
+            index = Project.index_by_id(original, kwargs["filepath"])
+
             for model in downloads:
                 if model.untranslated():
                     continue
 
                 skill_id, skill_type = model.key.split("|")
-                skill_id = int(skill_id)
-
-                for idx, skill in enumerate(original):
-                    if skill is None:
-                        continue
-
-                    if skill.id != skill_id:
-                        continue
+                idx = index.get(int(skill_id))
+                if idx is None:
+                    continue
 
-                    if "name" in skill_type:
-                        original[idx].name = model.translation
-                    elif "description" in skill_type:
-                        original[idx].description = model.translation
-                    else:
-                        raise
+                if "name" in skill_type:
+                    original[idx].name = model.translation
+                elif "description" in skill_type:
+                    original[idx].description = model.translation
+                else:
+                    raise
 
             return original
 
@@ -302,39 +561,44 @@ class Restorer:
     def _restore_common_events(self, filepath: Path, type_: FileType) -> list[BaseModel]:
         def _process(**kwargs):
             original: list[GameCommonEventModel] = [
-                GameCommonEventModel.model_validate(_) if _ is not None else _
+                GameCommonEventModel.load(_, strict=self.strict) if _ is not None else _
                 for _ in kwargs["original"]
             ]
             downloads: list[ParatranzModel] = [ParatranzModel.model_validate(_) for _ in kwargs["download"]]
 
+            events = {event.id: event for event in original if event is not None}
+            units: dict[tuple[int, int], GameCommonEventUnitModel] = {
+                (event.id, idx_unit): unit
+                for event in events.values()
+                for block in segment(event.list)
+                for idx_unit, unit in zip(block.indices, block.units)
+            }
+
+            missed, claimed = [], set()
             for model in downloads:
                 if model.untranslated():
                     continue
 
                 event_id, event_name, idx_unit, unit_code = (_.strip() for _ in model.key.split("|"))
                 event_id, idx_unit, unit_code = int(event_id), int(idx_unit), int(unit_code)
-                event_name = event_name.strip()
-
-                for idx_event, event in enumerate(original):
-                    if event is None:
-                        continue
-
-                    if any((event_id != event.id, event_name != event.name)):
-                        continue
-
-                    for idx_unit_, unit in enumerate(event.list):
-                        if Code.DIALOG == unit.code == unit_code:
-                            if model.original != unit.parameters[0]:
-                                continue
-                            original[idx_event].list[idx_unit_].parameters[0] = model.translation
-                        elif Code.CHOICE == unit.code == unit_code:
-                            if model.original != "\n".join(unit.parameters[0]):
-                                continue
-                            result_ = [
-                                _ or model.original.split("\n")[idx]
-                                for idx, _ in enumerate(model.translation.split("\n"))
-                            ]
-                            original[idx_event].list[idx_unit_].parameters[0] = result_
+
+                event = events.get(event_id)
+                if event is None or event.name != event_name:
+                    continue
+
+                position = (event_id, idx_unit)
+                unit = units.get(position)
+                if unit is not None and position not in claimed and self._restore_unit(unit, unit_code, model):
+                    claimed.add(position)
+                else:
+                    missed.append((event_id, unit_code, model))
+
+            # units moved since the text was uploaded, after every addressed unit is translated
+            for event_id, unit_code, model in missed:
+                self._restore_moved(
+                    ((position, unit) for position, unit in units.items() if position[0] == event_id),
+                    unit_code, model, claimed
+                )
 
             return original
 
@@ -347,21 +611,21 @@ class Restorer:
     def _restore_map_infos(self, filepath: Path, type_: FileType) -> BaseModel:
         def _process(**kwargs):
             original: list[GameMapInfoModel] = [
-                GameMapInfoModel.model_validate(_) if _ is not None else _
+                GameMapInfoModel.load(_, strict=self.strict) if _ is not None else _
                 for _ in kwargs["original"]
             ]
             downloads: list[ParatranzModel] = [ParatranzModel.model_validate(_) for _ in kwargs["download"]]
 
+            index = Project.index_by_id(original, kwargs["filepath"])
+
             for model in downloads:
                 if model.untranslated():
                     continue
 
-                for idx, info in enumerate(original):
-                    if info is None:
-                        continue
-                    if info.id != int(model.key):
-                        continue
-                    original[idx].name = model.translation
+                idx = index.get(int(model.key))
+                if idx is None:
+                    continue
+                original[idx].name = model.translation
             return original
 
         return self._restore_general(
@@ -370,6 +634,34 @@ class Restorer:
             process_function=_process,
         )
 
+    @property
+    def jobs(self) -> int:
+        return self._jobs
+
+    @property
+    def executor(self) -> Executor:
+        return self._executor
+
+    @property
+    def incremental(self) -> bool:
+        return self._incremental
+
+    @property
+    def strict(self) -> bool:
+        return self._strict
+
+    @property
+    def pretty(self) -> bool:
+        return self._pretty
+
+    @property
+    def download(self) -> DownloadView:
+        return self._download
+
+    @property
+    def optimize_png(self) -> bool:
+        return self._optimize_png
+
 
 __all__ = [
     "Restorer"
@@ -0,0 +1,56 @@
+"""Split event command lists into the dialog / choice blocks to translate."""
+from typing import Iterable, Iterator, NamedTuple
+
+from src.schema.enum import Code
+from src.schema.model import GameCommonEventUnitModel, GameMapUnitModel
+
+Unit = GameMapUnitModel | GameCommonEventUnitModel
+
+
+class Block(NamedTuple):
+    """contiguous units of the same text code"""
+    code: int
+    indices: range
+    units: list[Unit]
+    context: str
+
+
+def text(unit: Unit) -> str:
+    """original text of a dialog / choice unit as it is uploaded"""
+    if Code.CHOICE == unit.code:
+        return "\n".join(unit.parameters[0])  # list[str]
+    return unit.parameters[0]  # str
+
+
+def segment(units: Iterable[Unit]) -> Iterator[Block]:
+    """
+    walk a command list once
+
+    :param units: `list` of a map page or a common event
+    :return: dialog (401) and choice (102) blocks in order, with their joined lines as context
+    """
+    units = list(units)
+    idx, total = 0, len(units)
+    while idx < total:
+        code = units[idx].code
+        if Code.DIALOG != code and Code.CHOICE != code:
+            idx += 1
+            continue
+
+        start = idx
+        while idx < total and units[idx].code == code:
+            idx += 1
+        block = units[start:idx]
+        lines = (
+            (unit.parameters[0] for unit in block)
+            if Code.DIALOG == code
+            else (" | ".join(unit.parameters[0]) for unit in block)
+        )
+        yield Block(code, range(start, idx), block, "\n".join(lines).strip())
+
+
+__all__ = [
+    "Block",
+    "segment",
+    "text",
+]
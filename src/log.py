@@ -1,5 +1,6 @@
 """Output infos during running."""
 import datetime
+import os
 import sys
 
 from loguru import logger as logger_
@@ -28,7 +29,8 @@ logger_.remove()
 logger_ = logger_.patch(add_project_name)
 logger_ = logger_.patch(add_filepath)
 
-NOW = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+# worker processes re-import this module on spawn, keep them writing to the files of the main process
+NOW = os.environ.setdefault("PROJECT_LOG_TIMESTAMP", datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
 FORMAT = settings.project.log_format
 logger_.add(sink=sys.stdout, format=FORMAT, colorize=True, level=settings.project.log_level)
 logger_.add(sink=DIR_LOGS / f"{NOW}.log", format=FORMAT, colorize=False, level="INFO", encoding="utf-8")
@@ -20,7 +20,58 @@ class FileType(Enum):
     COMMON_EVENTS = auto()
 
 
+class ProcessStatus(Enum):
+    """outcome of converting / restoring one file"""
+    SUCCESS = auto()
+    BLANK = auto()
+    FAILED = auto()
+    SKIPPED = auto()  # unchanged since last run
+
+
+class SyncStatus(Enum):
+    """outcome of uploading one file to Paratranz"""
+    CREATED = auto()
+    UPDATED = auto()
+    SKIPPED = auto()  # nothing to upload since last push
+    FAILED = auto()
+
+
+class Executor(Enum):
+    """pool to run per-file work in"""
+    PROCESS = "process"
+    THREAD = "thread"
+
+
+class CopyStrategy(Enum):
+    """how files are placed from one tree into another"""
+    COPY = "copy"
+    HARDLINK = "hardlink"  # shares the data, same filesystem only
+    REFLINK = "reflink"  # copy-on-write clone, btrfs / xfs / ...
+    SYMLINK = "symlink"
+
+
+class JsonBackend(Enum):
+    """library to read / write json with"""
+    AUTO = "auto"  # the fastest one installed
+    ORJSON = "orjson"
+    MSGSPEC = "msgspec"
+    JSON = "json"
+
+
+class DuplicatePolicy(Enum):
+    """which downloaded entry wins when several share the same original text"""
+    FIRST = "first"  # the first entry in the downloaded file
+    KEY = "key"  # the entry whose key is exactly the unit's key, else the first one
+    STAGE = "stage"  # the entry with the highest (most checked) stage
+
+
 __all__ = [
     "Code",
     "FileType",
+    "ProcessStatus",
+    "SyncStatus",
+    "Executor",
+    "CopyStrategy",
+    "JsonBackend",
+    "DuplicatePolicy",
 ]
\ No newline at end of file
@@ -1,10 +1,96 @@
-from typing import Optional
+from functools import cache
+from types import UnionType
+from typing import Any, Callable, Optional, Self, Union, get_args, get_origin
 
 from pydantic import BaseModel, Field
 
 
 class _BaseModelAllowExtra(BaseModel, extra='allow'):
-    ...
+    @classmethod
+    def load(cls, data: dict, *, strict: bool = False) -> Self:
+        """
+        build the model from parsed json
+
+        :param data: parsed json object
+        :param strict: validate with pydantic (debug), otherwise trust the data and return a `_TrustedModel` view
+            which reads / writes the parsed json in place, and whose `model_dump` returns it as is
+        :return: the model, or a view of it
+        """
+        if strict:
+            return cls.model_validate(data)
+        return _TrustedModel(data, _wrappers(cls))
+
+
+class _TrustedModel:
+    """attribute view over a trusted json object, nested models are wrapped lazily on access"""
+    __slots__ = ("_data", "_fields")
+
+    def __init__(self, data: dict, fields: dict[str, Callable[[Any], Any]]):
+        object.__setattr__(self, "_data", data)
+        object.__setattr__(self, "_fields", fields)
+
+    def __getattr__(self, name: str):
+        try:
+            value = self._data[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        wrapper = self._fields.get(name)
+        return value if wrapper is None or value is None else wrapper(value)
+
+    def __setattr__(self, name: str, value):
+        self._data[name] = value
+
+    def model_dump(self) -> dict:
+        return self._data
+
+
+class _TrustedList:
+    """list view over a trusted json array of models"""
+    __slots__ = ("_data", "_wrapper")
+
+    def __init__(self, data: list, wrapper: Callable[[Any], Any]):
+        self._data = data
+        self._wrapper = wrapper
+
+    def __getitem__(self, idx: int | slice):
+        if isinstance(idx, slice):
+            return _TrustedList(self._data[idx], self._wrapper)
+        value = self._data[idx]
+        return None if value is None else self._wrapper(value)
+
+    def __iter__(self):
+        for value in self._data:
+            yield None if value is None else self._wrapper(value)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@cache
+def _wrapper(annotation) -> Callable[[Any], Any] | None:
+    """how a field's raw value is wrapped in trusted mode, None if it is used as is"""
+    origin = get_origin(annotation)
+    if origin in (Union, UnionType):
+        models = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _wrapper(models[0]) if len(models) == 1 else None
+    if origin is list:
+        args = get_args(annotation)
+        item = _wrapper(args[0]) if args else None
+        return None if item is None else lambda value: _TrustedList(value, item)
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        fields = _wrappers(annotation)
+        return lambda value: _TrustedModel(value, fields)
+    return None
+
+
+@cache
+def _wrappers(model: type[BaseModel]) -> dict[str, Callable[[Any], Any]]:
+    """wrappers of a model's fields which hold nested models"""
+    return {
+        name: wrapper
+        for name, field in model.model_fields.items()
+        if (wrapper := _wrapper(field.annotation)) is not None
+    }
 
 
 class ParatranzModel(_BaseModelAllowExtra):
@@ -35,6 +121,22 @@ class ParatranzProjectStatModel(_BaseModelAllowExtra):
 class ParatranzProjectModel(_BaseModelAllowExtra):
     """json schema for project info in Paratranz"""
     stats: ParatranzProjectStatModel
+    updatedAt: Optional[str] = Field(default=None)
+
+
+class ParatranzArtifactModel(_BaseModelAllowExtra):
+    """json schema for the latest export in Paratranz"""
+    id: int
+    createdAt: str
+
+
+class ParatranzFileModel(_BaseModelAllowExtra):
+    """json schema for files listed in Paratranz"""
+    id: int
+    """relative path, eg: www/data/Map001.json"""
+    name: str
+    hash: Optional[str] = Field(default=None)
+    modifiedAt: Optional[str] = Field(default=None)
 
 
 """ MAP """
@@ -118,6 +220,8 @@ class GamePluginModel(_BaseModelAllowExtra):
 __all__ = [
     'ParatranzModel',
     'ParatranzProjectModel',
+    'ParatranzFileModel',
+    'ParatranzArtifactModel',
     'ParatranzProjectStatModel',
 
     'GameMapUnitModel',
@@ -0,0 +1,83 @@
+import io
+import os
+import random
+import zipfile
+
+import pytest
+
+from src.core import archive
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """files of several kinds under a result-like tree"""
+    rng = random.Random(0)
+    root = tmp_path / "result"
+    for idx in range(40):
+        suffix = ".png" if idx % 5 == 0 else ".json"
+        filepath = root / "www" / f"dir{idx % 3}" / f"file{idx}{suffix}"
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath.write_bytes(
+            os.urandom(rng.randint(0, 3000)) if suffix == ".png"
+            else ('{"text": "%s"}' % ("文本" * rng.randint(0, 2000))).encode("utf-8")
+        )
+    (root / "汉化说明.txt").write_text("中文", encoding="utf-8")
+    (root / "empty.json").write_bytes(b"")
+    return root
+
+
+def _pack(files, **kwargs) -> bytes:
+    fp = io.BytesIO()
+    archive.pack(fp, files, jobs=4, **kwargs)
+    return fp.getvalue()
+
+
+def _check(data: bytes, files) -> zipfile.ZipFile:
+    zfp = zipfile.ZipFile(io.BytesIO(data))
+    assert zfp.testzip() is None
+    assert [info.filename for info in zfp.infolist()] == [file.arcname for file in files]
+    for file in files:
+        assert zfp.read(file.arcname) == file.path.read_bytes()
+    return zfp
+
+
+def test_pack_round_trip(tree):
+    files = archive.scan(tree)
+    zfp = _check(_pack(files), files)
+    for info in zfp.infolist():
+        expected = zipfile.ZIP_STORED if info.filename.endswith(".png") else zipfile.ZIP_DEFLATED
+        assert info.compress_type == expected
+
+
+def test_reproducible_archives_are_identical(tree):
+    files = archive.scan(tree)
+    first = _pack(files, reproducible=True)
+    os.utime(files[0].path, (0, 0))
+    assert _pack(archive.scan(tree), reproducible=True) == first
+
+
+def test_unchanged_entries_are_reused_from_the_previous_archive(tree, tmp_path):
+    files = archive.scan(tree)
+    previous = tmp_path / "previous.zip"
+    previous.write_bytes(_pack(files, reproducible=True))
+
+    changed = files[1].path
+    changed.write_bytes(changed.read_bytes() + b" ")
+    files = archive.scan(tree)
+    fp = io.BytesIO()
+    counter = archive.pack(fp, files, jobs=4, previous=previous, reproducible=True)
+
+    _check(fp.getvalue(), files)
+    assert counter == {True: len(files) - 1, False: 1}
+    # reused payloads make the same archive as compressing everything again
+    assert fp.getvalue() == _pack(files, reproducible=True)
+
+
+def test_zip64_records(tree, monkeypatch):
+    # as if every member, offset and count were past the limits of plain zip
+    monkeypatch.setattr(archive, "_ZIP64_LIMIT", 64)
+    monkeypatch.setattr(archive, "_ZIP64_COUNT_LIMIT", 8)
+    files = archive.scan(tree)
+    data = _pack(files)
+    _check(data, files)
+    assert b"PK\x06\x06" in data  # zip64 end of central directory
@@ -0,0 +1,107 @@
+import json
+import os
+
+import pytest
+
+from src.core import cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "DIR_CACHE", tmp_path / "cache")
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def source(tmp_path):
+    filepath = tmp_path / "Map001.json"
+    filepath.write_text('{"a": 1}', encoding="utf-8")
+    return filepath
+
+
+def _touch(filepath, content: str, mtime_ns: int):
+    filepath.write_text(content, encoding="utf-8")
+    os.utime(filepath, ns=(mtime_ns, mtime_ns))
+
+
+class _Parser:
+    """counts how often files are actually parsed"""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, filepath):
+        self.calls += 1
+        return json.loads(filepath.read_text(encoding="utf-8"))
+
+
+def test_manifest_round_trip(cache_dir):
+    manifest = cache.Manifest("test")
+    manifest.set("www/data/Map001.json", {"digest": "abc"})
+    manifest.save()
+    assert cache.Manifest("test").get("www/data/Map001.json") == {"digest": "abc"}
+    assert [path.name for path in cache_dir.iterdir()] == ["test.json"]  # no temporary file left
+
+
+def test_broken_manifest_is_ignored(cache_dir):
+    cache_dir.mkdir()
+    (cache_dir / "test.json").write_text("{broken", encoding="utf-8")
+    assert cache.Manifest("test").records == {}
+
+
+def test_parsed_cache_goes_stale_when_the_file_changes(source):
+    parsed, parse = cache.ParsedCache(1 << 20), _Parser()
+    assert parsed.get(source, parse) == {"a": 1}
+    assert parsed.get(source, parse) == {"a": 1}
+    assert parse.calls == 1
+
+    _touch(source, '{"a": 2}', source.stat().st_mtime_ns + 1_000_000)
+    assert parsed.get(source, parse) == {"a": 2}
+    assert parse.calls == 2
+
+
+def test_parsed_cache_hands_over_taken_entries(source):
+    parsed, parse = cache.ParsedCache(1 << 20), _Parser()
+    first = parsed.get(source, parse)
+    assert parsed.get(source, parse, take=True) is first
+    assert parsed.get(source, parse) is not first  # parsed again, the taken one may be modified
+    assert parse.calls == 2
+
+
+def test_parsed_cache_stays_within_its_budget(tmp_path):
+    files = []
+    for idx in range(4):
+        files.append(tmp_path / f"{idx}.json")
+        files[-1].write_text(f'["{"x" * 8}{idx}"]', encoding="utf-8")  # 13 bytes each
+    parsed, parse = cache.ParsedCache(30), _Parser()
+    for filepath in files:
+        parsed.get(filepath, parse)
+    assert parsed.size <= 30
+    parsed.get(files[-1], parse)
+    parsed.get(files[0], parse)  # evicted first
+    assert parse.calls == 5
+
+
+def test_snapshot_goes_stale_when_the_file_changes(source):
+    snapshot, parse = cache.Snapshot(), _Parser()
+    assert snapshot.get(source, parse) == {"a": 1}
+    snapshot.save()
+
+    reloaded = cache.Snapshot()  # next run
+    assert reloaded.get(source, parse) == {"a": 1}
+    assert parse.calls == 1
+
+    _touch(source, '{"a": 2}', source.stat().st_mtime_ns + 1_000_000)
+    assert reloaded.get(source, parse) == {"a": 2}
+    assert parse.calls == 2
+    assert len(list(reloaded.directory.glob("*.pickle"))) == 1  # the stale snapshot is dropped
+
+
+def test_snapshot_index_records_of_workers_are_merged(source, tmp_path):
+    other = tmp_path / "Map002.json"
+    other.write_text("[]", encoding="utf-8")
+    worker, parent = cache.Snapshot(), cache.Snapshot()
+    worker.get(source, _Parser())
+    parent.get(other, _Parser())
+    parent.merge(worker.updates())
+    parent.save()
+    assert set(cache.Snapshot().index.records) == {source.as_posix(), other.as_posix()}
@@ -0,0 +1,44 @@
+import io
+import json
+
+import pytest
+
+from src import codec
+from src.schema.enum import JsonBackend
+
+DATA = {
+    "text": "汉化 \"quoted\" \\ \n",
+    "numbers": [0, -1, 1.5, 2 ** 40],
+    "nested": [None, True, False, {"empty": [], "more": {}}],
+}
+
+
+@pytest.fixture(params=[JsonBackend.ORJSON, JsonBackend.MSGSPEC, JsonBackend.JSON])
+def backend(request, monkeypatch) -> JsonBackend:
+    if request.param != JsonBackend.JSON:
+        pytest.importorskip(request.param.value)
+    monkeypatch.setattr(codec, "BACKEND", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_round_trip(backend, pretty):
+    fp = io.BytesIO()
+    codec.json_dump(DATA, fp, pretty=pretty)
+    fp.seek(0)
+    assert codec.json_load(fp) == DATA
+
+
+def test_compact_output_is_the_same_for_every_backend(backend):
+    assert codec.json_dumps(DATA) == json.dumps(DATA, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def test_pretty_output_is_indented_with_two_spaces(backend):
+    assert json.loads(codec.json_dumps(DATA, pretty=True)) == DATA
+    assert b'\n  "text"' in codec.json_dumps(DATA, pretty=True)
+
+
+def test_what_a_fast_backend_refuses_falls_back_to_json(backend):
+    big = {"id": 2 ** 70}
+    assert codec.json_loads(codec.json_dumps(big)) == big
+    assert codec.json_loads(b'{"id": 1180591620717411303424}') == big
@@ -0,0 +1,100 @@
+import json
+import random
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from src.core import archive, delta
+from src.core.delta_apply import apply, patch
+
+
+def _events(rng: random.Random) -> list[dict]:
+    return [
+        {
+            "id": idx,
+            "list": [{"code": 401, "parameters": [f"line {line} {'x' * rng.randint(0, 40)}"]} for line in range(20)],
+        }
+        for idx in range(300)
+    ]
+
+
+def _write(root: Path, files: dict[str, str]):
+    for name, content in files.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(content, encoding="utf-8")
+
+
+@pytest.fixture
+def release(tmp_path):
+    """a result tree, its release archive and a game patched with it"""
+    rng = random.Random(0)
+    events = _events(rng)
+    root, game, base = tmp_path / "result", tmp_path / "game", tmp_path / "base.zip"
+    _write(root, {
+        "www/data/Map001.json": json.dumps(events, separators=(",", ":")),
+        "www/data/Small.json": "[1]",
+        "www/data/Gone.json": "[2]",
+    })
+    with base.open("wb") as fp:
+        archive.pack(fp, archive.scan(root), jobs=2, reproducible=True)
+    with zipfile.ZipFile(base) as zfp:
+        zfp.extractall(game)
+
+    # the next release: an event inserted, a line edited, files added, changed and removed
+    events.insert(150, {"id": 9999, "list": []})
+    events[10]["list"][3]["parameters"][0] = "edited"
+    _write(root, {
+        "www/data/Map001.json": json.dumps(events, separators=(",", ":")),
+        "www/data/Small.json": "[3]",
+        "www/new.txt": "new",
+    })
+    (root / "www/data/Gone.json").unlink()
+    return root, game, base
+
+
+def _tree(root: Path) -> dict[str, bytes]:
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in root.glob("**/*") if path.is_file()}
+
+
+def test_diff_then_patch_gives_the_new_version():
+    rng = random.Random(1)
+    base = json.dumps(_events(rng), separators=(",", ":")).encode()
+    data = base[:5000] + b'{"inserted":true},' + base[5000:]
+    ops, inserted = delta.diff(base, data)
+    assert patch(base, ops, inserted) == data
+    assert len(inserted) < len(data) // 10
+
+
+def test_delta_applied_onto_the_release_gives_the_new_tree(release, tmp_path):
+    root, game, base = release
+    archive_path = tmp_path / "delta.zip"
+    with archive_path.open("wb") as fp:
+        manifest = delta.build(fp, archive.scan(root), base)
+
+    assert manifest["files"] == ["www/data/Small.json", "www/new.txt"]
+    assert list(manifest["patched"]) == ["www/data/Map001.json"]
+    assert manifest["deleted"] == ["www/data/Gone.json"]
+    assert archive_path.stat().st_size < base.stat().st_size
+
+    apply(archive_path, game)
+    assert _tree(game) == _tree(root)
+
+
+def test_shipped_script_refuses_another_base(release, tmp_path):
+    root, game, base = release
+    archive_path = tmp_path / "delta.zip"
+    with archive_path.open("wb") as fp:
+        delta.build(fp, archive.scan(root), base)
+    with zipfile.ZipFile(archive_path) as zfp:
+        zfp.extract("apply_delta.py", tmp_path)
+
+    (game / "www/data/Map001.json").write_text("[]", encoding="utf-8")
+    result = subprocess.run(
+        [sys.executable, tmp_path / "apply_delta.py", archive_path, game], capture_output=True, text=True
+    )
+    assert result.returncode != 0
+    assert "install the full release" in result.stderr
+    assert (game / "www/data/Gone.json").exists()  # nothing touched
@@ -0,0 +1,120 @@
+import random
+import struct
+import zlib
+
+import pytest
+
+from src.core import png
+
+
+def _png(width: int, height: int, color_type: int, pixels: bytes, *chunks: tuple[bytes, bytes]) -> bytes:
+    """unfiltered PNG of 8-bit `pixels`"""
+    stride = width * png._CHANNELS[color_type]
+    raw = b"".join(b"\x00" + pixels[y * stride:(y + 1) * stride] for y in range(height))
+    return png.write_chunks([
+        (b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)),
+        *chunks,
+        (b"IDAT", zlib.compress(raw, 1)),
+        (b"IEND", b""),
+    ])
+
+
+def _unfilter(raw: bytes, width: int, height: int, bpp: int) -> bytes:
+    """byte by byte as the specification reads, to check the optimizer against"""
+    stride, pixels, prev, pos = width * bpp, bytearray(), [0] * width * bpp, 0
+    for _ in range(height):
+        filter_type, line = raw[pos], list(raw[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        for i in range(stride):
+            a, b, c = line[i - bpp] if i >= bpp else 0, prev[i], prev[i - bpp] if i >= bpp else 0
+            if filter_type == 4:
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                predictor = a if pa <= pb and pa <= pc else b if pb <= pc else c
+            else:
+                predictor = [0, a, b, (a + b) // 2][filter_type]
+            line[i] = (line[i] + predictor) & 0xFF
+        pixels += bytes(line)
+        prev = line
+    return bytes(pixels)
+
+
+def _rgba(data: bytes) -> bytes:
+    """pixels of an 8-bit PNG as RGBA"""
+    chunks = png.read_chunks(data)
+    width, height, _, color_type, _, _, _ = struct.unpack(">IIBBBBB", chunks[0][1])
+    raw = zlib.decompress(b"".join(chunk for type_, chunk in chunks if type_ == b"IDAT"))
+    ancillary = dict(chunks)
+    image = png.Image(
+        width, height, color_type, _unfilter(raw, width, height, png._CHANNELS[color_type]),
+        palette=ancillary.get(b"PLTE", b""), transparency=ancillary.get(b"tRNS", b""),
+    )
+    return png.expand(image)
+
+
+@pytest.fixture
+def rng() -> random.Random:
+    return random.Random(0)
+
+
+def _images(rng: random.Random) -> dict[str, bytes]:
+    width, height = 37, 23
+    colors = [bytes([rng.randrange(256) for _ in range(3)]) + bytes([alpha]) for alpha in (0, 128, 255, 255)]
+    return {
+        "few colors with alpha": _png(width, height, 6, b"".join(rng.choice(colors) for _ in range(width * height))),
+        "opaque gradient": _png(width, height, 6, b"".join(
+            bytes([x * 7 % 256, y * 11 % 256, (x * y) % 256, 255]) for y in range(height) for x in range(width)
+        )),
+        "noise": _png(width, height, 6, bytes(rng.randrange(256) for _ in range(width * height * 4))),
+        "rgb": _png(width, height, 2, b"".join(
+            bytes([x % 256, y % 256, (x + y) % 256]) for y in range(height) for x in range(width)
+        ), (b"gAMA", struct.pack(">I", 45455))),
+        "indexed": _png(
+            width, height, 3, bytes(rng.randrange(4) for _ in range(width * height)),
+            (b"PLTE", bytes(rng.randrange(256) for _ in range(12))),
+        ),
+    }
+
+
+def test_optimized_pixels_equal_the_original(rng):
+    for name, data in _images(rng).items():
+        optimized = png.optimize(data)
+        assert len(optimized) <= len(data), name
+        assert _rgba(optimized) == _rgba(data), name
+
+
+def test_every_filter_type_is_read_back(rng):
+    image = png.Image(19, 11, 6, bytes(rng.randrange(256) for _ in range(19 * 11 * 4)))
+    raw = b"".join(row[idx % 5] for idx, row in enumerate(png.filter_rows(image)))
+    assert png.unfilter(raw, 19, 11, 4) == image.pixels == _unfilter(raw, 19, 11, 4)
+
+
+@pytest.fixture
+def optimize_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(png, "DIR_PNG_CACHE", tmp_path / "cache")
+
+    def _optimize(data: bytes) -> bytes:
+        source, destination = tmp_path / "source.png", tmp_path / "result" / "source.png"
+        source.write_bytes(data)
+        png.optimize_file(source, destination)
+        return destination.read_bytes()
+
+    return _optimize
+
+
+def test_broken_images_are_shipped_as_they_are(rng, optimize_file):
+    data = _images(rng)["opaque gradient"]
+    chunks = png.read_chunks(data)
+    idat = dict(chunks)[b"IDAT"]
+    short_scanlines = png.write_chunks([
+        *chunks[:-2], (b"IDAT", zlib.compress(zlib.decompress(idat)[:-100])), (b"IEND", b"")
+    ])
+    for broken in (data[:len(data) // 2], short_scanlines, b"not a png at all"):
+        assert optimize_file(broken) == broken
+
+
+def test_optimized_file_comes_from_the_cache(rng, optimize_file, monkeypatch):
+    data = _images(rng)["few colors with alpha"]
+    optimized = optimize_file(data)
+    monkeypatch.setattr(png, "optimize", lambda _: pytest.fail("optimized again"))
+    assert optimize_file(data) == optimized
@@ -0,0 +1,47 @@
+import io
+import random
+import re
+
+import pytest
+
+from src.core.quest import tokenize_quests
+
+_REFERENCE = re.compile(r"<quest (\d+?):[\s\S]+?\|\d+?\|\d+?>[\s\S]+?</quest>")
+
+
+def _quest_file(rng: random.Random) -> str:
+    pieces = ["// quests\n"]
+    for idx in range(rng.randint(1, 40)):
+        pieces.append(
+            f"<quest {idx}:Title {'任务' * rng.randint(0, 3)}|{rng.randint(0, 9)}|{rng.randint(0, 3)}>\n"
+            f"{'Line with <b>tags</b> and | pipes.' * rng.randint(1, 5)}\n</quest>"
+        )
+        pieces.append(rng.choice(["\n", "\n\n", "\n<quest broken\n", "\n// comment <quest x:\n"]))
+    return "".join(pieces)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_quests_and_text_between_join_back_to_the_file(seed):
+    text = _quest_file(random.Random(seed))
+    pieces, last = [], 0
+    for quest in tokenize_quests(text):
+        start, end = quest.span
+        assert text[start:end] == quest.raw
+        pieces += [text[last:start], quest.raw]
+        last = end
+    pieces.append(text[last:])
+    assert "".join(pieces) == text
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_same_quests_as_the_regex(seed):
+    text = _quest_file(random.Random(seed))
+    assert [(quest.id, quest.raw) for quest in tokenize_quests(text)] == [
+        (matched.group(1), matched.group()) for matched in _REFERENCE.finditer(text)
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 16])
+def test_streams_give_the_same_quests(chunk_size):
+    text = _quest_file(random.Random(0))
+    assert list(tokenize_quests(io.StringIO(text), chunk_size=chunk_size)) == list(tokenize_quests(text))
@@ -0,0 +1,167 @@
+import json
+import random
+
+import pytest
+
+import src.core.restorer as restorer
+from src.core import Restorer
+from src.schema.enum import FileType
+
+
+@pytest.fixture
+def restore(tmp_path, monkeypatch):
+    """writes a game file and its download, returns a function restoring them"""
+    game_root, download = tmp_path / "game", tmp_path / "download"
+    monkeypatch.setattr(restorer, "GAME_ROOT", game_root)
+    monkeypatch.setattr(restorer, "DIR_DOWNLOAD", download)
+
+    def _restore(name: str, type_: FileType, data, entries: list[dict], *, strict: bool = False):
+        original = game_root / "www" / "data" / name
+        downloaded = download / "www" / "data" / f"{name}.json"
+        original.parent.mkdir(parents=True, exist_ok=True)
+        downloaded.parent.mkdir(parents=True, exist_ok=True)
+        original.write_text(json.dumps(data), encoding="utf-8")
+        downloaded.write_text(json.dumps(entries), encoding="utf-8")
+        restorer_ = Restorer(jobs=1, strict=strict)
+        match type_:
+            case FileType.MAP:
+                return restorer_._restore_map(downloaded, type_)
+            case FileType.COMMON_EVENTS:
+                return restorer_._restore_common_events(downloaded, type_)
+            case FileType.SYSTEM:
+                return restorer_._restore_system(downloaded, type_)
+
+    return _restore
+
+
+@pytest.fixture
+def common_events(restore):
+    def _restore(units: list[dict], entries: list[dict], *, strict: bool = False) -> list:
+        data = [None, {"id": 1, "name": "Event", "list": units}]
+        return restore("CommonEvents.json", FileType.COMMON_EVENTS, data, entries, strict=strict)
+
+    return _restore
+
+
+def _dialog(line: str) -> dict:
+    return {"code": 401, "indent": 0, "parameters": [line]}
+
+
+def _other() -> dict:
+    return {"code": 0, "indent": 0, "parameters": []}
+
+
+def _dump(result) -> list | dict:
+    if isinstance(result, list):
+        return [_.model_dump() if _ is not None else None for _ in result]
+    return result.model_dump()
+
+
+@pytest.mark.parametrize("strict", [True, False])
+def test_moved_duplicates_each_find_their_own_unit(common_events, strict):
+    # a command was inserted before both lines since they were uploaded at units 0 and 2
+    events = common_events(
+        [{"code": 355, "indent": 0, "parameters": ["script"]}, _dialog("Hi"), _other(), _dialog("Hi"), _other()],
+        [
+            {"key": "1 | Event | 0 | 401", "original": "Hi", "translation": "First"},
+            {"key": "1 | Event | 2 | 401", "original": "Hi", "translation": "Second"},
+        ],
+        strict=strict,
+    )
+    assert [unit.parameters for unit in events[1].list[1:4:2]] == [["First"], ["Second"]]
+
+
+@pytest.mark.parametrize("strict", [True, False])
+def test_moved_duplicate_does_not_take_an_addressed_unit(common_events, strict):
+    # unit 2 is still in place, the moved entry of unit 0 must not overwrite it
+    events = common_events(
+        [_other(), _other(), _dialog("Hi"), _other(), _dialog("Hi")],
+        [
+            {"key": "1 | Event | 0 | 401", "original": "Hi", "translation": "Moved"},
+            {"key": "1 | Event | 2 | 401", "original": "Hi", "translation": "Addressed"},
+        ],
+        strict=strict,
+    )
+    assert [unit.parameters for unit in events[1].list[2::2]] == [["Addressed"], ["Moved"]]
+
+
+def _random_units(rng: random.Random) -> list[dict]:
+    return [_dialog(rng.choice("ABC")) if rng.random() < 0.6 else _other() for _ in range(rng.randint(1, 12))]
+
+
+def _random_entries(rng: random.Random, prefix: str, units: list[dict]) -> list[dict]:
+    """entries of the dialog units, some addressed at a shifted index as if commands were inserted"""
+    entries = []
+    for idx, unit in enumerate(units):
+        if unit["code"] == 401 and rng.random() < 0.8:
+            shift = rng.choice([0, 0, 1, -1, 3])
+            line = unit["parameters"][0]
+            entries.append({"key": f"{prefix} | {idx + shift} | 401", "original": line, "translation": f"{line}{idx}"})
+    rng.shuffle(entries)
+    return entries
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_trusted_and_strict_common_events_agree(restore, seed):
+    rng = random.Random(seed)
+    units = _random_units(rng)
+    data = [None, {"id": 1, "name": "Event", "list": units}]
+    entries = _random_entries(rng, "1 | Event", units)
+    results = [
+        _dump(restore(f"CommonEvents{seed}.json", FileType.COMMON_EVENTS, data, entries, strict=strict))
+        for strict in (True, False)
+    ]
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_trusted_and_strict_maps_agree(restore, seed):
+    rng = random.Random(seed)
+    pages = [_random_units(rng) for _ in range(rng.randint(1, 3))]
+    data = {"displayName": "", "events": [None, {"id": 1, "name": "Event", "pages": [{"list": _} for _ in pages]}]}
+    entries = [
+        entry
+        for idx_page, units in enumerate(pages)
+        for entry in _random_entries(rng, f"1 | Event | {idx_page}", units)
+    ]
+    results = [
+        _dump(restore(f"Map{seed:03}.json", FileType.MAP, data, entries, strict=strict))
+        for strict in (True, False)
+    ]
+    assert results[0] == results[1]
+
+
+def test_system_fallback_ignores_translations_written_before(restore):
+    # slot 1 is translated into "Attack" first, the moved "Attack" entry belongs to slot 0 only
+    system = restore(
+        "System.json", FileType.SYSTEM,
+        {
+            "gameTitle": "Game", "locale": "en_US", "skillTypes": [],
+            "terms": {"basic": ["Attack", "Guard"], "commands": [], "params": [], "messages": {}},
+        },
+        [
+            {"key": "terms | basic | 1", "original": "Guard", "translation": "Attack"},
+            {"key": "terms | basic | 9", "original": "Attack", "translation": "Strike"},
+        ],
+    )
+    assert system.terms.basic == ["Strike", "Attack"]
+
+
+@pytest.mark.parametrize("strict", [True, False])
+@pytest.mark.parametrize("reverse", [False, True])
+def test_system_addressed_entries_go_first(restore, strict, reverse):
+    # the moved entry must not take slot 1, which its own entry addresses, whatever the order of entries
+    entries = [
+        {"key": "terms | basic | 9", "original": "HP", "translation": "X"},
+        {"key": "terms | basic | 1", "original": "HP", "translation": "Y"},
+    ]
+    system = restore(
+        "System.json", FileType.SYSTEM,
+        {
+            "gameTitle": "Game", "locale": "en_US", "skillTypes": [],
+            "terms": {"basic": ["HP", "HP"], "commands": [], "params": [], "messages": {}},
+        },
+        entries[::-1] if reverse else entries,
+        strict=strict,
+    )
+    assert system.terms.basic == ["X", "Y"]